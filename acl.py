@@ -0,0 +1,187 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import threading
+from datetime import datetime
+from cache import LRUCache, MISSING
+
+##############################################################
+#
+#   Config
+#
+
+# maximum number of lock in acl cache of one worker
+ACL_CACHE_SIZE = int( os.getenv( 'ACL_CACHE_SIZE', 10000 ) )
+
+# seconds that acl of lock is kept in cache
+# NOTE: upper bound of stale acl when invalidation is missed
+ACL_CACHE_TTL = float( os.getenv( 'ACL_CACHE_TTL', 60 ) )
+
+##############################################################
+#
+#   Lock ACL
+#
+
+class LockAcl:
+    '''
+        Snapshot of who can unlock a lock
+        NOTE: acl is shared between request and must not be modified
+        for example:
+            acl = LockAcl( 'lock01', admins = { 'js7694' }, members = set(), guests = { 'tw8769': datetime( 2024, 10, 25, 18, 0 ) } )
+            acl.role( 'tw8769' ) => 'guest'
+            acl.role( 'tw8769', datetime( 2024, 10, 26 ) ) => None
+    '''
+
+    __slots__ = ( 'lockId', 'admins', 'members', 'guests', 'deleted' )
+
+    def __init__( self, lockId, admins = (), members = (), guests = None, deleted = False ):
+        '''
+            Input: lockId (str), userId of admin (iterable), userId of member (iterable),
+                   dict of userId of guest and expire datetime (dict), lock is tombstone or not found (bool)
+        '''
+
+        self.lockId = lockId
+        self.admins = frozenset( admins )
+        self.members = frozenset( members )
+        self.guests = dict( guests or {} )
+        self.deleted = deleted
+
+    def role( self, userId, now = None ):
+        '''
+            Get role of user in lock
+            Input: userId (str), current datetime (datetime)(optional)
+            Output: role (str) admin, member, guest or None if user is not in lock or guest is expired
+        '''
+
+        if self.deleted:
+            return None
+
+        if userId in self.admins:
+            return 'admin'
+
+        if userId in self.members:
+            return 'member'
+
+        expireDatetime = self.guests.get( userId, MISSING )
+        if expireDatetime is MISSING:
+            return None
+
+        # NOTE: guest without expire datetime never expire
+        if expireDatetime is None or expireDatetime > ( now or datetime.now() ):
+            return 'guest'
+
+        return None
+
+    def expire_datetime( self, userId ):
+        '''
+            Get expire datetime of user in lock
+            Input: userId (str)
+            Output: expire datetime (datetime) of guest or None
+        '''
+
+        return self.guests.get( userId )
+
+##############################################################
+#
+#   Lock ACL Cache
+#
+
+class LockAclCache:
+    '''
+        Cache of acl by lockId
+        acl is loaded lazily by one Locks query and one Memberships query and kept in cache with TTL
+        handler that change membership of lock must invalidate lockId
+        for example:
+            acl = LockAclCache( db, memberships )
+            await acl.role( 'js7694', 'lock01' ) => 'admin'
+            acl.invalidate( [ 'lock01' ] )
+        NOTE: guest expiry is checked against expire datetime in acl so expired guest is denied
+              before guest expiry scheduler delete membership
+    '''
+
+    def __init__( self, db, memberships, cache = None ):
+        '''
+            Input: database, membership store (MembershipStore), cache of acl (CacheBackend)(optional)
+        '''
+
+        self.db = db
+        self.memberships = memberships
+        self.cache = cache if cache is not None else LRUCache( ACL_CACHE_SIZE, ACL_CACHE_TTL, namespace = 'acl' )
+
+        # number of invalidation, acl that is loaded while lock is invalidated is not cached
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    async def load( self, lockId ):
+        '''
+            Load acl of lock from database
+            Input: lockId (str)
+            Output: acl (LockAcl)
+        '''
+
+        # NOTE: live lock without deleted field is projected to {}, check None instead of falsy
+        lock = await self.db['Locks'].find_one( { 'lockId': lockId }, { '_id': 1, 'deleted': 1 } )
+        if lock is None or lock.get( 'deleted' ):
+            return LockAcl( lockId, deleted = True )
+
+        admins, members, guests = set(), set(), dict()
+        for membership in await self.memberships.roster( lockId ):
+            if membership['role'] == 'admin':
+                admins.add( membership['userId'] )
+            elif membership['role'] == 'member':
+                members.add( membership['userId'] )
+            elif membership['role'] == 'guest':
+                guests[membership['userId']] = membership.get( 'expireDatetime' )
+
+        return LockAcl( lockId, admins, members, guests )
+
+    async def get( self, lockId ):
+        '''
+            Get acl of lock from cache or load it when it is not in cache
+            Input: lockId (str)
+            Output: acl (LockAcl)
+        '''
+
+        acl = self.cache.get( lockId )
+        if acl is not MISSING:
+            return acl
+
+        generation = self.generation
+        acl = await self.load( lockId )
+
+        # NOTE: skip acl that may be loaded before invalidation of lock
+        with self.lock:
+            if generation == self.generation:
+                self.cache.set( lockId, acl )
+
+        return acl
+
+    async def role( self, userId, lockId ):
+        '''
+            Get role of user in lock
+            Input: userId (str), lockId (str)
+            Output: role (str) admin, member, guest or None if user is not in lock
+        '''
+
+        return ( await self.get( lockId ) ).role( userId )
+
+    def invalidate( self, lockIds ):
+        '''
+            Delete acl of lock from cache
+            Input: list of lockId (list)
+        '''
+
+        with self.lock:
+            self.generation += 1
+            self.cache.delete_many( lockIds )
+
+    def stats( self ):
+        '''
+            Get counter of cache
+            Output: dict of counter
+        '''
+
+        return self.cache.stats()
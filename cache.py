@@ -0,0 +1,671 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import json
+import time
+import uuid
+import pickle
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pymongo.errors import PyMongoError
+from starlette.concurrency import run_in_threadpool
+
+# NOTE: redis is needed only when CACHE_BACKEND=redis
+try:
+    import redis
+except ImportError:
+    redis = None
+
+##############################################################
+#
+#   Config
+#
+
+# maximum number of user profile in cache of one worker
+PROFILE_CACHE_SIZE = int( os.getenv( 'PROFILE_CACHE_SIZE', 10000 ) )
+
+# seconds that user profile is kept in cache
+# NOTE: upper bound of stale profile when invalidation is missed
+PROFILE_CACHE_TTL = float( os.getenv( 'PROFILE_CACHE_TTL', 300 ) )
+
+# broadcast invalidation to other worker by change stream of invalidation collection
+# NOTE: change stream need replica set, e.g. Atlas cluster
+CACHE_INVALIDATION_BROADCAST = os.getenv( 'CACHE_INVALIDATION_BROADCAST', 'false' ).lower() == 'true'
+
+# backend of cache, memory is cache of one worker and redis is shared by every worker
+CACHE_BACKEND = os.getenv( 'CACHE_BACKEND', 'memory' ).lower()
+
+# url of redis server when CACHE_BACKEND=redis
+REDIS_URL = os.getenv( 'REDIS_URL', 'redis://localhost:6379/0' )
+
+# prefix of every key and channel in redis
+REDIS_PREFIX = os.getenv( 'REDIS_PREFIX', 'fsl' )
+
+# value that is returned when key is not in cache
+MISSING = object()
+
+##############################################################
+#
+#   Cache Backend
+#
+
+class CacheBackend:
+    '''
+        Interface of cache of one namespace with time to live
+        backend count hit, miss and latency of get and set so cache can be sized by stats
+        for example:
+            cache = make_cache( 'profile', maxSize = 1000, ttl = 60 )
+            cache.set( 'js7694', { 'firstName': 'Josephine' } )
+            cache.get( 'js7694' ) => { 'firstName': 'Josephine' }
+            cache.get_many( [ 'js7694', 'tw8769' ] ) => { 'js7694': { 'firstName': 'Josephine' } }
+            cache.delete_many( [ 'js7694' ] )
+        NOTE: value is shared between request, caller must not modify it
+    '''
+
+    def __init__( self, namespace, ttl ):
+        '''
+            Input: namespace (str), seconds that key is kept (float)
+        '''
+
+        self.namespace = namespace
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+        # operation -> [ count, total seconds, max seconds ]
+        self.latencies = { 'get': [ 0, 0.0, 0.0 ], 'set': [ 0, 0.0, 0.0 ], 'delete': [ 0, 0.0, 0.0 ] }
+
+    def record( self, operation, seconds, hits = 0, misses = 0 ):
+        '''
+            Count latency of operation and hit and miss of lookup
+            Input: operation (str) get, set or delete, seconds (float), number of hit (int), number of miss (int)
+        '''
+
+        with self.lock:
+            latency = self.latencies[operation]
+            latency[0] += 1
+            latency[1] += seconds
+            latency[2] = max( latency[2], seconds )
+
+            self.hits += hits
+            self.misses += misses
+
+    def get( self, key, default = MISSING ):
+        '''
+            Get value of key
+            Input: key (str), default value
+            Output: value or default if key is not in cache or expired
+        '''
+
+        value = self.get_many( [ key ] ).get( key, MISSING )
+
+        return default if value is MISSING else value
+
+    def get_many( self, keys ):
+        '''
+            Get value of every key that is in cache
+            Input: list of key (list)
+            Output: dict of key and value
+        '''
+
+        raise NotImplementedError
+
+    def set( self, key, value ):
+        '''
+            Set value of key
+            Input: key (str), value
+        '''
+
+        raise NotImplementedError
+
+    def delete_many( self, keys ):
+        '''
+            Delete every key from cache
+            Input: list of key (list)
+        '''
+
+        raise NotImplementedError
+
+    def clear( self ):
+        '''
+            Delete every key of namespace from cache
+        '''
+
+        raise NotImplementedError
+
+    def size( self ):
+        '''
+            Get number of key in cache
+            Output: number of key (int) or None if it is unknown
+        '''
+
+        return None
+
+    def stats( self ):
+        '''
+            Get counter of cache
+            Output: dict of counter
+            for example:
+            {
+                'backend': 'memory',
+                'size': 812,
+                'maxSize': 10000,
+                'hits': 15230,
+                'misses': 940,
+                'hitRatio': 0.9419,
+                'evictions': 0,
+                'expirations': 128,
+                'invalidations': 12,
+                'latencyMs': {
+                    'get': { 'count': 9120, 'avg': 0.004, 'max': 0.21 },
+                    'set': { 'count': 940, 'avg': 0.003, 'max': 0.05 },
+                    'delete': { 'count': 12, 'avg': 0.002, 'max': 0.01 }
+                }
+            }
+            NOTE: counter is of this worker, evictions and expirations are counted only by memory backend
+        '''
+
+        size = self.size()
+
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.backend,
+                'size': size,
+                'maxSize': getattr( self, 'maxSize', None ),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRatio': round( self.hits / lookups, 4 ) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'latencyMs': {
+                    operation: {
+                        'count': count,
+                        'avg': round( total * 1000 / count, 3 ) if count else None,
+                        'max': round( maximum * 1000, 3 ),
+                    }
+                    for operation, ( count, total, maximum ) in self.latencies.items()
+                },
+            }
+
+##############################################################
+#
+#   LRU Cache
+#
+
+class LRUCache( CacheBackend ):
+    '''
+        Thread-safe in-process cache with least recently used eviction and time to live
+        NOTE: value is shared between request, caller must not modify it
+        for example:
+            cache = LRUCache( maxSize = 1000, ttl = 60 )
+            cache.set( 'js7694', { 'firstName': 'Josephine' } )
+            cache.get( 'js7694' ) => { 'firstName': 'Josephine' }
+            cache.get( 'tw8769' ) => MISSING
+    '''
+
+    backend = 'memory'
+
+    def __init__( self, maxSize, ttl, namespace = None ):
+        '''
+            Input: maximum number of key (int), seconds that key is kept (float), namespace (str)(optional)
+        '''
+
+        super().__init__( namespace, ttl )
+
+        self.maxSize = maxSize
+
+        # key -> ( expire time, value ) order by last used
+        self.entries = OrderedDict()
+
+    def get_many( self, keys ):
+        '''
+            Get value of every key that is in cache
+            Input: list of key (list)
+            Output: dict of key and value
+        '''
+
+        start = time.perf_counter()
+
+        values = dict()
+        with self.lock:
+            now = time.monotonic()
+            for key in keys:
+                entry = self.entries.get( key )
+                if entry is None:
+                    continue
+
+                # in case key is expired
+                if entry[0] <= now:
+                    del self.entries[key]
+                    self.expirations += 1
+                    continue
+
+                self.entries.move_to_end( key )
+                values[key] = entry[1]
+
+        self.record( 'get', time.perf_counter() - start, hits = len( values ), misses = len( keys ) - len( values ) )
+
+        return values
+
+    def set( self, key, value ):
+        '''
+            Set value of key and evict least recently used key when cache is full
+            Input: key, value
+        '''
+
+        start = time.perf_counter()
+
+        with self.lock:
+            self.entries[key] = ( time.monotonic() + self.ttl, value )
+            self.entries.move_to_end( key )
+
+            while len( self.entries ) > self.maxSize:
+                self.entries.popitem( last = False )
+                self.evictions += 1
+
+        self.record( 'set', time.perf_counter() - start )
+
+    def delete_many( self, keys ):
+        '''
+            Delete every key from cache
+            Input: list of key (list)
+        '''
+
+        start = time.perf_counter()
+
+        with self.lock:
+            for key in keys:
+                if self.entries.pop( key, None ) is not None:
+                    self.invalidations += 1
+
+        self.record( 'delete', time.perf_counter() - start )
+
+    def clear( self ):
+        '''
+            Delete every key from cache
+        '''
+
+        with self.lock:
+            self.entries.clear()
+
+    def size( self ):
+        '''
+            Get number of key in cache
+            Output: number of key (int)
+        '''
+
+        with self.lock:
+            return len( self.entries )
+
+##############################################################
+#
+#   Redis Cache
+#
+
+class RedisCache( CacheBackend ):
+    '''
+        Cache that is shared by every worker on redis server
+        key is stored as <prefix>:<namespace>:<key> with time to live of redis so there is no maxSize
+        eviction is done by maxmemory-policy of redis server e.g. allkeys-lru
+        for example:
+            cache = RedisCache( 'profile', ttl = 60 )
+            cache = RedisCache( 'profile', ttl = 60, client = fakeredis.FakeRedis() )
+        NOTE: value is pickled, redis server must be trusted
+        NOTE: error of redis is counted as miss so request fall back to database
+    '''
+
+    backend = 'redis'
+
+    def __init__( self, namespace, ttl, client = None, url = REDIS_URL, prefix = REDIS_PREFIX ):
+        '''
+            Input: namespace (str), seconds that key is kept (float), redis client (optional), url of redis (str)(optional), prefix of key (str)(optional)
+        '''
+
+        super().__init__( namespace, ttl )
+
+        if client is None:
+            if redis is None:
+                raise RuntimeError( 'redis package is required for CACHE_BACKEND=redis' )
+            client = redis.Redis.from_url( url )
+
+        self.client = client
+        self.prefix = '%s:%s:' % ( prefix, namespace )
+
+    def get_many( self, keys ):
+        '''
+            Get value of every key that is in cache by one MGET
+            Input: list of key (list)
+            Output: dict of key and value
+        '''
+
+        keys = list( keys )
+        if not keys:
+            return dict()
+
+        start = time.perf_counter()
+
+        try:
+            payloads = self.client.mget( [ self.prefix + str( key ) for key in keys ] )
+        except redis.RedisError as e:
+            print( e )
+            payloads = [ None ] * len( keys )
+
+        values = { key: pickle.loads( payload ) for key, payload in zip( keys, payloads ) if payload is not None }
+
+        self.record( 'get', time.perf_counter() - start, hits = len( values ), misses = len( keys ) - len( values ) )
+
+        return values
+
+    def set( self, key, value ):
+        '''
+            Set value of key with time to live
+            Input: key, value
+        '''
+
+        start = time.perf_counter()
+
+        try:
+            self.client.set( self.prefix + str( key ), pickle.dumps( value ), px = int( self.ttl * 1000 ) )
+        except redis.RedisError as e:
+            print( e )
+
+        self.record( 'set', time.perf_counter() - start )
+
+    def delete_many( self, keys ):
+        '''
+            Delete every key from cache by one DEL
+            Input: list of key (list)
+        '''
+
+        keys = list( keys )
+        if not keys:
+            return
+
+        start = time.perf_counter()
+
+        try:
+            deleted = self.client.delete( *[ self.prefix + str( key ) for key in keys ] )
+        except redis.RedisError as e:
+            print( e )
+            deleted = 0
+
+        with self.lock:
+            self.invalidations += deleted
+
+        self.record( 'delete', time.perf_counter() - start )
+
+    def clear( self ):
+        '''
+            Delete every key of namespace from cache
+            NOTE: scan key by prefix, it is for maintenance not for request
+        '''
+
+        for keys in self.scan_batches():
+            self.client.delete( *keys )
+
+    def scan_batches( self, batchSize = 500 ):
+        '''
+            Get key of namespace in batch
+            Input: number of key in one batch (int)
+            Output: generator of list of key
+        '''
+
+        batch = list()
+        for key in self.client.scan_iter( match = self.prefix + '*', count = batchSize ):
+            batch.append( key )
+            if len( batch ) >= batchSize:
+                yield batch
+                batch = list()
+
+        if batch:
+            yield batch
+
+def make_cache( namespace, maxSize, ttl, backend = CACHE_BACKEND ):
+    '''
+        Make cache of namespace by backend that is configured
+        Input: namespace (str), maximum number of key of memory backend (int), seconds that key is kept (float), backend (str) memory or redis
+        Output: cache (CacheBackend)
+    '''
+
+    if backend == 'redis':
+        return RedisCache( namespace, ttl )
+
+    return LRUCache( maxSize, ttl, namespace = namespace )
+
+##############################################################
+#
+#   Cache Invalidator
+#
+
+class CacheInvalidator:
+    '''
+        Broadcast invalidation of cache key to every worker
+        worker insert invalidation into collection and every worker watch insert by change stream in background task
+        invalidation of the worker itself is skipped because it is already deleted from local cache
+        invalidation document:
+        {
+            'namespace': 'profile',
+            'keys': [ 'js7694' ],
+            'origin': '5f1c0e1e2b7a4c7e9a3d2c1b0a9f8e7d',
+            'datetime': datetime( 2024, 10, 25, 18, 45, 3 )
+        }
+        NOTE: invalidation that is sent while worker is not watching is covered by ttl of cache
+    '''
+
+    def __init__( self, db, collectionName = 'CacheInvalidation', enabled = CACHE_INVALIDATION_BROADCAST ):
+        '''
+            Input: database, name of invalidation collection (str), broadcast to other worker (bool)
+        '''
+
+        self.db = db
+        self.collectionName = collectionName
+        self.enabled = enabled
+
+        # id of this worker
+        self.origin = uuid.uuid4().hex
+
+        # namespace -> list of callback( keys )
+        self.callbacks = dict()
+
+        self.task = None
+        self.thread = None
+        self.running = False
+
+    def subscribe( self, namespace, callback ):
+        '''
+            Call callback when key of namespace is invalidated
+            Input: namespace (str), callback( list of key )
+        '''
+
+        self.callbacks.setdefault( namespace, list() ).append( callback )
+
+    async def invalidate( self, namespace, keys ):
+        '''
+            Invalidate key in this worker and broadcast to other worker
+            Input: namespace (str), list of key (list)
+        '''
+
+        for callback in self.callbacks.get( namespace, [] ):
+            callback( keys )
+
+        if not self.enabled:
+            return
+
+        await self.publish( { 'namespace': namespace, 'keys': list( keys ), 'origin': self.origin } )
+
+    def receive( self, invalidation ):
+        '''
+            Call callback of invalidation from other worker
+            Input: invalidation (dict)
+        '''
+
+        if invalidation['origin'] == self.origin:
+            return
+
+        for callback in self.callbacks.get( invalidation['namespace'], [] ):
+            callback( invalidation['keys'] )
+
+    async def publish( self, invalidation ):
+        '''
+            Send invalidation to other worker by invalidation collection
+            Input: invalidation (dict)
+        '''
+
+        # NOTE: broadcast is best effort, cache of other worker expire by ttl when it is failed
+        try:
+            await self.db[self.collectionName].insert_one( { **invalidation, 'datetime': datetime.now() } )
+        except PyMongoError as e:
+            print( e )
+
+    async def start( self ):
+        '''
+            Start background task in event loop when broadcast is enabled
+        '''
+
+        if not self.enabled:
+            return
+
+        self.running = True
+        self.task = asyncio.get_running_loop().create_task( self.run() )
+
+    async def stop( self ):
+        '''
+            Stop background task
+        '''
+
+        self.running = False
+
+        if self.task:
+            try:
+                await asyncio.wait_for( self.task, timeout = 5 )
+            except asyncio.TimeoutError:
+                pass
+
+    async def run( self ):
+        '''
+            Loop of background task
+            NOTE: watch again from last change when change stream is broken
+        '''
+
+        resumeToken = None
+
+        while self.running:
+            try:
+                async with await self.db[self.collectionName].watch( [ { '$match': { 'operationType': 'insert' } } ], resume_after = resumeToken, max_await_time_ms = 1000 ) as stream:
+                    while self.running and stream.alive:
+                        change = await stream.try_next()
+                        resumeToken = stream.resume_token
+                        if change is None:
+                            continue
+
+                        self.receive( change['fullDocument'] )
+
+            except PyMongoError as e:
+                print( e )
+                await asyncio.sleep( 1 )
+
+class RedisCacheInvalidator( CacheInvalidator ):
+    '''
+        Broadcast invalidation of cache key to every worker by pub/sub channel of redis
+        it does not need replica set and message is not stored
+        for example:
+            cacheInvalidator = RedisCacheInvalidator()
+            cacheInvalidator = RedisCacheInvalidator( client = fakeredis.FakeRedis() )
+        NOTE: invalidation that is sent while worker is not subscribed is covered by ttl of cache
+    '''
+
+    def __init__( self, client = None, url = REDIS_URL, channel = REDIS_PREFIX + ':cache-invalidation', enabled = True ):
+        '''
+            Input: redis client (optional), url of redis (str)(optional), name of channel (str)(optional), broadcast to other worker (bool)
+        '''
+
+        super().__init__( None, enabled = enabled )
+
+        if client is None:
+            if redis is None:
+                raise RuntimeError( 'redis package is required for CACHE_BACKEND=redis' )
+            client = redis.Redis.from_url( url )
+
+        self.client = client
+        self.channel = channel
+
+    async def publish( self, invalidation ):
+        '''
+            Send invalidation to other worker by channel
+            Input: invalidation (dict)
+        '''
+
+        # NOTE: broadcast is best effort, cache of other worker expire by ttl when it is failed
+        # NOTE: redis client is blocking so it is run in thread, not in event loop
+        try:
+            await run_in_threadpool( self.client.publish, self.channel, json.dumps( invalidation ) )
+        except redis.RedisError as e:
+            print( e )
+
+    async def start( self ):
+        '''
+            Start background thread that wait for message of channel
+        '''
+
+        self.running = True
+        self.thread = threading.Thread( target = self.run, name = 'cache-invalidator', daemon = True )
+        self.thread.start()
+
+    async def stop( self ):
+        '''
+            Stop background thread
+        '''
+
+        self.running = False
+
+        if self.thread:
+            await run_in_threadpool( self.thread.join, 5 )
+
+    def run( self ):
+        '''
+            Loop of background thread
+            NOTE: subscribe again when connection is broken
+        '''
+
+        while self.running:
+            try:
+                pubsub = self.client.pubsub( ignore_subscribe_messages = True )
+                pubsub.subscribe( self.channel )
+
+                while self.running:
+                    message = pubsub.get_message( timeout = 1 )
+                    if message is None:
+                        continue
+
+                    self.receive( json.loads( message['data'] ) )
+
+                pubsub.close()
+
+            except redis.RedisError as e:
+                print( e )
+                time.sleep( 1 )
+
+def make_cache_invalidator( db, backend = CACHE_BACKEND ):
+    '''
+        Make cache invalidator by backend that is configured
+        Input: database, backend (str) memory or redis
+        Output: cache invalidator (CacheInvalidator)
+    '''
+
+    if backend == 'redis':
+        return RedisCacheInvalidator()
+
+    return CacheInvalidator( db )
@@ -0,0 +1,285 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import anyio.to_thread
+
+##############################################################
+#
+#   Config
+#
+
+# number of thread that run blocking call of handler e.g. fsync of journal
+# NOTE: handler is async def and wait for database in event loop, thread is used only by blocking call
+THREADPOOL_SIZE = int( os.getenv( 'THREADPOOL_SIZE', 40 ) )
+
+##############################################################
+#
+#   Event Loop
+#
+
+# event loop of worker that own database client
+eventLoop = None
+
+def bind_event_loop():
+    '''
+        Keep event loop of worker so background thread can run coroutine in it
+        NOTE: must be called in event loop, e.g. in startup event
+    '''
+
+    global eventLoop
+    eventLoop = asyncio.get_running_loop()
+
+def in_event_loop( function ):
+    '''
+        Get callable that run coroutine function in event loop of worker and wait for result
+        background thread use it because database client is bound to event loop
+        for example:
+            reaper = LockReaper( in_event_loop( reap_locks ) )
+        Input: coroutine function
+        Output: callable that take the same argument
+        NOTE: callable must be called from background thread, event loop would wait for itself
+    '''
+
+    def call( *args ):
+        return asyncio.run_coroutine_threadsafe( function( *args ), eventLoop ).result()
+
+    return call
+
+def set_threadpool_size( size = THREADPOOL_SIZE ):
+    '''
+        Set number of thread that run blocking call
+        NOTE: must be called in event loop, e.g. in startup event
+        Input: number of thread (int)
+    '''
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = size
+
+##############################################################
+#
+#   Simulated Database
+#
+
+class SimulatedClient:
+    '''
+        In-memory database with latency of every round trip for benchmark
+        every operation wait for latency in event loop then run on mongomock,
+        at most poolSize operation wait at the same time like connection pool of AsyncMongoClient
+        for example:
+            client = SimulatedClient( latency = 0.02 )
+            await client['Fido']['Users'].find_one( { 'userId': 'js7694' } )
+        NOTE: mongomock must be installed, it does not support every aggregation stage e.g. $lookup with pipeline
+        NOTE: mongomock run in event loop, so time that real server spend in query is counted as handler time
+    '''
+
+    def __init__( self, latency, poolSize = 100 ):
+        '''
+            Input: seconds of one round trip (float), number of operation that run at the same time (int)
+        '''
+
+        import mongomock
+
+        self.client = mongomock.MongoClient()
+        self.latency = latency
+        self.pool = asyncio.Semaphore( poolSize )
+        self.roundTrips = 0
+
+    async def round_trip( self, call ):
+        '''
+            Wait for latency of one round trip then run call
+            Input: callable without argument
+            Output: result of call
+        '''
+
+        async with self.pool:
+            self.roundTrips += 1
+            await asyncio.sleep( self.latency )
+            return call()
+
+    def __getitem__( self, name ):
+        return SimulatedDatabase( self, self.client[name] )
+
+class SimulatedDatabase:
+    def __init__( self, client, database ):
+        self.client = client
+        self.database = database
+
+    def __getitem__( self, name ):
+        return SimulatedCollection( self.client, self.database[name] )
+
+class SimulatedCollection:
+    '''
+        Collection with the same coroutine method as AsyncCollection
+    '''
+
+    def __init__( self, client, collection ):
+        self.client = client
+        self.collection = collection
+
+    def find( self, *args, **kwargs ):
+        return SimulatedCursor( self.client, lambda: self.collection.find( *args, **kwargs ) )
+
+    async def aggregate( self, pipeline, **kwargs ):
+        return SimulatedCursor( self.client, lambda: self.collection.aggregate( pipeline ) )
+
+    def __getattr__( self, name ):
+        method = getattr( self.collection, name )
+
+        async def call( *args, session = None, **kwargs ):
+            return await self.client.round_trip( lambda: method( *args, **kwargs ) )
+
+        return call
+
+class SimulatedCursor:
+    '''
+        Cursor that fetch every document by one round trip
+    '''
+
+    def __init__( self, client, open ):
+        self.client = client
+        self.open = open
+        self.chain = list()
+
+    def sort( self, *args, **kwargs ):
+        self.chain.append( ( 'sort', args, kwargs ) )
+        return self
+
+    def skip( self, *args ):
+        self.chain.append( ( 'skip', args, {} ) )
+        return self
+
+    def limit( self, *args ):
+        self.chain.append( ( 'limit', args, {} ) )
+        return self
+
+    def fetch( self ):
+        cursor = self.open()
+        for name, args, kwargs in self.chain:
+            cursor = getattr( cursor, name )( *args, **kwargs )
+        return list( cursor )
+
+    async def to_list( self, length = None ):
+        documents = await self.client.round_trip( self.fetch )
+        return documents[:length] if length else documents
+
+    async def __aiter__( self ):
+        for document in await self.to_list():
+            yield document
+
+    async def close( self ):
+        pass
+
+##############################################################
+#
+#   Benchmark
+#
+
+async def seed_database( app, locks, usersPerLock ):
+    '''
+        Add lock, user and membership to database of app
+        Input: main module, number of lock (int), number of user per lock (int)
+        Output: list of ( userId, lockId ) of admin (list)
+    '''
+
+    admins = list()
+    users, memberships = list(), list()
+    start = app.datetime( 2024, 10, 25 )
+
+    for lockIndex in range( locks ):
+        lockId = 'lock%05d' % lockIndex
+        lockUsers = [ 'user%05d-%d' % ( lockIndex, userIndex ) for userIndex in range( usersPerLock ) ]
+        admins.append( ( lockUsers[0], lockId ) )
+
+        users += [ { 'userId': userId, 'userCode': len( users ) + index, 'firstName': 'User', 'lastName': userId, 'userImage': None, 'email': userId + '@example.com', 'lockLocationList': [ 'Home' ] } for index, userId in enumerate( lockUsers ) ]
+        memberships += [
+            { 'userId': userId, 'lockId': lockId, 'role': 'admin' if index == 0 else 'member', 'lockName': 'Front Door', 'lockLocation': 'Home', 'lockImage': None, 'expireDatetime': None, 'datetime': start }
+            for index, userId in enumerate( lockUsers )
+        ]
+
+        await app.db['Locks'].insert_one( { 'lockId': lockId, 'securityStatus': 'secure', 'invitation': [], 'request': [], 'schemaVersion': app.SCHEMA_VERSION['Locks'], 'warningCount': 0, 'version': 0 } )
+
+    await app.db['Users'].insert_many( users )
+    await app.db['Memberships'].insert_many( memberships )
+
+    return admins
+
+async def run_benchmark( app, requests, handlerLimit, admins ):
+    '''
+        Send request to handler of app at the same time
+        Input: main module, number of request (int), number of handler that run at the same time (int) or None,
+               list of ( userId, lockId ) of admin (list)
+        Output: request per second (float)
+    '''
+
+    limit = asyncio.Semaphore( handlerLimit ) if handlerLimit else None
+
+    async def request( index ):
+        userId, lockId = admins[index % len( admins )]
+        handler = [
+            lambda: app.get_lock_detail( lockId, userId, app.Response(), None ),
+            lambda: app.get_user_lock( app.Response(), userId, None, None ),
+            lambda: app.get_lock_location( userId, app.Response(), None ),
+        ][index % 3]
+
+        if limit is None:
+            return await handler()
+
+        async with limit:
+            return await handler()
+
+    start = time.perf_counter()
+    await asyncio.gather( *[ request( index ) for index in range( requests ) ] )
+
+    return requests / ( time.perf_counter() - start )
+
+async def benchmark( requests, latency, locks ):
+    '''
+        Measure throughput of handler of app on simulated database
+        Input: number of request (int), seconds of one round trip (float), number of lock (int)
+    '''
+
+    import main as app
+
+    # NOTE: client of app is replaced before first use, so every store of app use simulated database
+    client = SimulatedClient( latency )
+    app.mongo.client = client
+    app.mongo.pid = os.getpid()
+    app.mongo.transactional = False
+
+    admins = await seed_database( app, locks, 5 )
+
+    # fill cache of user profile before measure so every run read the same from database
+    await run_benchmark( app, 3 * len( admins ), None, admins )
+
+    print( 'requests=%d latency=%.3fs locks=%d' % ( requests, latency, locks ) )
+    for label, handlerLimit in [ ( 'handlers=40 (threadpool of plain def)', 40 ), ( 'handlers=unbounded (async def)', None ) ]:
+        client.roundTrips = 0
+        throughput = await run_benchmark( app, requests, handlerLimit, admins )
+        print( '%-40s %8.1f request/s %6.1f round trip/request' % ( label, throughput, client.roundTrips / requests ) )
+
+def main():
+    '''
+        python concurrency.py => throughput of async handler on simulated database with latency,
+                                 limited to 40 handler at the same time like threadpool of plain def and unbounded
+        python concurrency.py --requests 2000 --latency 0.02
+        NOTE: mongomock must be installed
+    '''
+
+    parser = argparse.ArgumentParser( description = 'Benchmark async handler under simulated database latency' )
+    parser.add_argument( '--requests', type = int, default = 1000, help = 'number of request that is sent at the same time' )
+    parser.add_argument( '--latency', type = float, default = 0.02, help = 'seconds of one database round trip' )
+    parser.add_argument( '--locks', type = int, default = 50, help = 'number of lock in database' )
+    args = parser.parse_args()
+
+    asyncio.run( benchmark( args.requests, args.latency, args.locks ) )
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit( main() )
@@ -57,6 +57,12 @@ class AcceptAllRequest( BaseModel ):
     lockId: str
     expireDatetime: datetime
 
+# class for accept or decline many request
+class HandleRequest( BaseModel ):
+    reqIds: List[str]
+    action: str
+    expireDatetime: Optional[datetime] = None
+
 # class for new invitation
 class NewInvitation( BaseModel ):
     srcUserId: str
@@ -118,14 +124,16 @@ class NewWarning( BaseModel ):
     # userRole: Optional[str] = None
     lockId: str
 
-# class for guest
-class Guest( BaseModel ):
+# class for membership of user in lock
+class Membership( BaseModel ):
     userId: str
     lockId: str
+    role: str
     lockName: str
     lockLocation: str
     lockImage: Optional[str] = None
-    expireDatetime: datetime
+    expireDatetime: Optional[ datetime ] = None
+    datetime: datetime
 
 # class for new lock
 class NewLock( BaseModel ):
@@ -139,21 +147,13 @@ class NewLock( BaseModel ):
 class Lock( BaseModel ):
     lockId: str
     securityStatus: str
-    admin: List[ str ]
-    member: List[ str ]
-    guest: List[ Guest ]
     invitation: List[ str ]
     request: List[ str ]
-    history: List[ str ]
-    connect: List[ str ]
-    warning: List[ str ]
-
-# class for lock details
-class LockDetail( BaseModel ):
-    lockId: str
-    lockName: str
-    lockLocation: str
-    lockImage: Optional[str] = None
+    warningCount: int = 0
+    lastWarningDatetime: Optional[ datetime ] = None
+    lastConnectDatetime: Optional[ datetime ] = None
+    version: int = 0
+    schemaVersion: int
 
 # class for users
 class User( BaseModel ):
@@ -164,9 +164,8 @@ class User( BaseModel ):
     userId: str
     userCode: int
     lockLocationList: List[ str ]
-    admin: List[ LockDetail ]
-    member: List[ LockDetail ]
-    guest: List[ Guest ]
+    version: int = 0
+    schemaVersion: int
 
 # class for user edit profile
 class UserEditProfile( BaseModel ):
@@ -192,4 +191,19 @@ class EditLockDetail( BaseModel ):
     lockId: str
     newLockName: Optional[str] = None
     newLockLocation: Optional[str] = None
-    newLockImage: Optional[str] = None
\ No newline at end of file
+    newLockImage: Optional[str] = None
+
+# class for inbox
+class InboxEntry( BaseModel ):
+    inboxId: str
+    userId: str
+    mode: str
+    subMode: Optional[str] = None
+    lockId: str
+    refId: str
+    actorUserId: Optional[str] = None
+    role: Optional[str] = None
+    lockName: Optional[str] = None
+    lockLocation: Optional[str] = None
+    datetime: datetime
+    isRead: bool
@@ -0,0 +1,241 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+from datetime import datetime
+from pymongo import UpdateOne
+
+##############################################################
+#
+#   Config
+#
+
+# maximum number of event in one bucket
+# NOTE: busy lock roll over to new bucket of the same day when bucket is full
+LOCK_EVENT_BUCKET_SIZE = int( os.getenv( 'LOCK_EVENT_BUCKET_SIZE', 200 ) )
+
+##############################################################
+#
+#   Lock Event Store
+#
+
+class LockEventStore:
+    '''
+        Store compact event of lock in bucket of one lock per day
+        lock document keep only summary field so it does not grow with every event
+        bucket document:
+        {
+            'lockId': '12345',
+            'day': datetime( 2024, 10, 25 ),
+            'count': 2,
+            'first': datetime( 2024, 10, 25, 8, 15, 45 ),
+            'last': datetime( 2024, 10, 25, 18, 45, 3 ),
+            'events': [
+                { 'kind': 'connect', 'id': 'con00031', 'userId': 'js7694', 'datetime': datetime( 2024, 10, 25, 8, 15, 45 ) },
+                { 'kind': 'history', 'id': 'his00052', 'userId': 'js7694', 'datetime': datetime( 2024, 10, 25, 8, 15, 45 ), 'status': 'connect' },
+            ]
+        }
+    '''
+
+    def __init__( self, db, collectionName = 'LockEvents', bucketSize = LOCK_EVENT_BUCKET_SIZE ):
+        '''
+            Input: database, name of bucket collection (str), bucket size (int)
+        '''
+
+        self.db = db
+        self.collectionName = collectionName
+        self.bucketSize = bucketSize
+
+    def event_update( self, lockId, kind, eventId, userId, dateTime, **fields ):
+        '''
+            Get update that append event to bucket of the day that is not full
+            Input: lockId (str), kind (str) history, connect or warning, event id (str), userId (str), date time (datetime)
+                   other field of event e.g. status of history, message of warning
+            Output: UpdateOne
+        '''
+
+        event = { 'kind': kind, 'id': eventId, 'userId': userId, 'datetime': dateTime, **fields }
+
+        return UpdateOne(
+            { 'lockId': lockId, 'day': datetime( dateTime.year, dateTime.month, dateTime.day ), 'count': { '$lt': self.bucketSize } },
+            {
+                '$push': { 'events': event },
+                '$inc': { 'count': 1 },
+                '$min': { 'first': dateTime },
+                '$max': { 'last': dateTime },
+            },
+            upsert = True,
+        )
+
+    async def append( self, lockId, kind, eventId, userId, dateTime, session = None, **fields ):
+        '''
+            Append event to bucket of the day
+            Input: lockId (str), kind (str), event id (str), userId (str), date time (datetime),
+                   session of transaction (AsyncClientSession)(optional), other field of event
+        '''
+
+        await self.db[self.collectionName].bulk_write( [ self.event_update( lockId, kind, eventId, userId, dateTime, **fields ) ], session = session )
+
+    @staticmethod
+    def bucket_query( lockIds, since = None, until = None ):
+        '''
+            Get filter of bucket of locks that has event in since and until
+            NOTE: day bound let index lockId_day skip bucket of other day
+            Input: list of lockId (list), since (datetime)(optional), until (datetime)(optional)
+            Output: filter (dict)
+        '''
+
+        bucketQuery = { 'lockId': { '$in': lockIds } }
+        if since or until:
+            bucketQuery['day'] = dict()
+        if since:
+            bucketQuery['day']['$gte'] = datetime( since.year, since.month, since.day )
+            bucketQuery['last'] = { '$gte': since }
+        if until:
+            bucketQuery['day']['$lte'] = datetime( until.year, until.month, until.day )
+            bucketQuery['first'] = { '$lte': until }
+
+        return bucketQuery
+
+    @staticmethod
+    def event_stages( kind, since = None, until = None, match = None ):
+        '''
+            Get aggregation stage that unwind event of matched bucket to one document per event
+            Input: kind (str), since (datetime)(optional), until (datetime)(optional)
+                   match of event after unwind (dict)(optional) e.g. { 'status': 'connect' }
+            Output: list of stage (list)
+        '''
+
+        eventQuery = { 'events.kind': kind }
+        if since or until:
+            eventQuery['events.datetime'] = dict()
+        if since:
+            eventQuery['events.datetime']['$gte'] = since
+        if until:
+            eventQuery['events.datetime']['$lte'] = until
+
+        stages = [
+            { '$unwind': '$events' },
+            { '$match': eventQuery },
+            { '$set': { 'events.lockId': '$lockId' } },
+            { '$replaceRoot': { 'newRoot': '$events' } },
+        ]
+        if match:
+            stages.append( { '$match': match } )
+
+        return stages
+
+    def pipeline( self, lockIds, kind, since = None, until = None, match = None ):
+        '''
+            Get aggregation stage that unwind event of locks to one document per event
+            bucket that is out of since and until is skipped before unwind
+            NOTE: every bucket in range is read, use find with limit to read only buckets of one page
+            Input: list of lockId (list), kind (str), since (datetime)(optional), until (datetime)(optional)
+                   match of event after unwind (dict)(optional) e.g. { 'status': 'connect' }
+            Output: list of stage (list)
+        '''
+
+        return [ { '$match': self.bucket_query( lockIds, since, until ) } ] + self.event_stages( kind, since, until, match )
+
+    async def find( self, lockIds, kind, since = None, until = None, match = None, limit = None, ascending = False ):
+        '''
+            Get event of locks order by date time, newest first unless ascending
+            with limit, bucket is read day by day in order of index lockId_day and reading stop
+            when the days that are read hold limit event, so bucket of older day is never loaded
+            for example:
+                await find( [ '12345' ], 'connect', limit = 20 )  => 20 newest connect of lock 12345
+                await find( [ '12345' ], 'connect', until = cursorDatetime, match = cursorQuery, limit = 20 )  => next page
+            Input: list of lockId (list), kind (str), since (datetime)(optional), until (datetime)(optional),
+                   match of event (dict)(optional), limit (int)(optional), oldest first (bool)(optional)
+            Output: list of event (list)
+        '''
+
+        collection = self.db[self.collectionName]
+        order = 1 if ascending else -1
+        bucketQuery = self.bucket_query( lockIds, since, until )
+        sortStage = { '$sort': { 'datetime': order, 'id': order } }
+
+        # without limit every bucket in range is read by one aggregation
+        if not limit:
+            return await ( await collection.aggregate( [ { '$match': bucketQuery } ] + self.event_stages( kind, since, until, match ) + [ sortStage ] ) ).to_list()
+
+        async def read( bucketIds ):
+            return await ( await collection.aggregate( [ { '$match': { '_id': { '$in': bucketIds } } } ] + self.event_stages( kind, since, until, match ) + [ sortStage ] ) ).to_list()
+
+        # get only id and size of bucket, then read event of whole days until page is full
+        # NOTE: days do not overlap so event of later day in order never belong before event that is read
+        # NOTE: count of bucket include every kind so day group is read again until limit event match
+        buckets = collection.find( bucketQuery, { '_id': 1, 'day': 1, 'count': 1 } ).sort( 'day', order )
+        events = list()
+        bucketIds, bucketCount, day = list(), 0, None
+        async for bucket in buckets:
+            # read days before this bucket when they hold enough event for the rest of page
+            if bucket['day'] != day and bucketIds and bucketCount >= limit - len( events ):
+                events += await read( bucketIds )
+                bucketIds, bucketCount = list(), 0
+                if len( events ) >= limit:
+                    break
+
+            day = bucket['day']
+            bucketIds.append( bucket['_id'] )
+            bucketCount += bucket['count']
+        else:
+            if bucketIds:
+                events += await read( bucketIds )
+
+        await buckets.close()
+
+        return events[:limit]
+
+    async def count( self, lockIds, kind, since = None, sinceId = None ):
+        '''
+            Count event of locks that is newer than since
+            event is counted inside bucket so bucket is not unwound
+            Input: list of lockId (list), kind (str), since (datetime)(optional),
+                   id of event at since (str)(optional), event at since with greater id is counted too
+            Output: number of event (int)
+        '''
+
+        condition = [ { '$eq': [ '$$event.kind', kind ] } ]
+        if since:
+            after = { '$gt': [ '$$event.datetime', since ] }
+            if sinceId is not None:
+                after = { '$or': [ after, { '$and': [ { '$eq': [ '$$event.datetime', since ] }, { '$gt': [ '$$event.id', sinceId ] } ] } ] }
+            condition.append( after )
+
+        result = await ( await self.db[self.collectionName].aggregate( [
+            { '$match': self.bucket_query( lockIds, since ) },
+            { '$group': { '_id': None, 'amount': { '$sum': { '$size': { '$filter': { 'input': '$events', 'as': 'event', 'cond': { '$and': condition } } } } } } },
+        ] ) ).to_list()
+
+        return result[0]['amount'] if result else 0
+
+    async def dismiss( self, lockId, kind, eventIds = None ):
+        '''
+            Mark event of lock as dismissed
+            if eventIds is not given, dismiss every event of kind
+            Input: lockId (str), kind (str), list of event id (list)(optional)
+            Output: number of bucket that is changed (int)
+        '''
+
+        eventFilter = { 'e.kind': kind, 'e.dismissed': { '$ne': True } }
+        if eventIds is not None:
+            eventFilter['e.id'] = { '$in': eventIds }
+
+        result = await self.db[self.collectionName].update_many(
+            { 'lockId': lockId, 'events': { '$elemMatch': { key[2:]: value for key, value in eventFilter.items() } } },
+            { '$set': { 'events.$[e].dismissed': True } },
+            array_filters = [ eventFilter ],
+        )
+
+        return result.modified_count
+
+    async def delete( self, lockIds ):
+        '''
+            Delete every bucket of locks
+            Input: list of lockId (list)
+        '''
+
+        await self.db[self.collectionName].delete_many( { 'lockId': { '$in': lockIds } } )
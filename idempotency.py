@@ -0,0 +1,239 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+
+##############################################################
+#
+#   Config
+#
+
+# seconds that response of idempotency key is kept and replayed
+# NOTE: index datetime_ttl of IdempotencyKeys delete key after this
+IDEMPOTENCY_TTL = int( os.getenv( 'IDEMPOTENCY_TTL', 24 * 60 * 60 ) )
+
+# seconds after that key that is still in progress is taken over by retry
+# NOTE: key of worker that crash in the middle of request is never completed
+IDEMPOTENCY_LOCK_TIMEOUT = int( os.getenv( 'IDEMPOTENCY_LOCK_TIMEOUT', 60 ) )
+
+# maximum length of idempotency key
+IDEMPOTENCY_KEY_LENGTH = 255
+
+# header of idempotency key that is sent by client
+IDEMPOTENCY_HEADER = b'idempotency-key'
+
+# method that change data, key of other method is ignored
+IDEMPOTENT_METHODS = { 'POST', 'PUT', 'PATCH', 'DELETE' }
+
+##############################################################
+#
+#   Idempotency Store
+#
+
+class IdempotencyStore:
+    '''
+        Fingerprint and response of every request that is sent with idempotency key
+        key document:
+        {
+            '_id': '6f1c2e0a-7f4b-4d7e-9a57-1d2a4c0b8e11',
+            'fingerprint': 'sha256 of method, path, query and body',
+            'status': 'done',
+            'response': { 'statusCode': 200, 'contentType': 'application/json', 'body': b'{...}' },
+            'datetime': datetime( 2024, 10, 24, 9, 30 )
+        }
+        NOTE: status is pending while first request is handled
+    '''
+
+    def __init__( self, db, collectionName = 'IdempotencyKeys', lockTimeout = IDEMPOTENCY_LOCK_TIMEOUT ):
+        '''
+            Input: database, name of key collection (str), seconds after that pending key is taken over (int)
+        '''
+
+        self.db = db
+        self.collectionName = collectionName
+        self.lockTimeout = lockTimeout
+
+    @staticmethod
+    def fingerprint( method, path, query, body ):
+        '''
+            Get fingerprint of request
+            Input: method (str), path (str), query string (bytes), body (bytes)
+            Output: sha256 hex digest (str)
+        '''
+
+        digest = hashlib.sha256()
+        for part in [ method.encode(), path.encode(), query, body ]:
+            digest.update( hashlib.sha256( part ).digest() )
+
+        return digest.hexdigest()
+
+    async def begin( self, key, fingerprint ):
+        '''
+            Reserve key for request
+            Input: idempotency key (str), fingerprint of request (str)
+            Output: None if key is reserved for this request else key document that already exists
+        '''
+
+        collection = self.db[self.collectionName]
+        now = datetime.now()
+
+        try:
+            await collection.insert_one( { '_id': key, 'fingerprint': fingerprint, 'status': 'pending', 'datetime': now } )
+            return None
+        except DuplicateKeyError:
+            pass
+
+        # take over key that is pending too long
+        # NOTE: only request with the same fingerprint can take over
+        taken = await collection.find_one_and_update(
+            { '_id': key, 'fingerprint': fingerprint, 'status': 'pending', 'datetime': { '$lt': now - timedelta( seconds = self.lockTimeout ) } },
+            { '$set': { 'datetime': now } },
+        )
+        if taken:
+            return None
+
+        # NOTE: key can be deleted by TTL index between insert and find, reserve it again in that case
+        existing = await collection.find_one( { '_id': key } )
+        return existing if existing else await self.begin( key, fingerprint )
+
+    async def complete( self, key, statusCode, contentType, body ):
+        '''
+            Save response of key so retry is replayed
+            Input: idempotency key (str), status code (int), content type (str), body (bytes)
+        '''
+
+        await self.db[self.collectionName].update_one(
+            { '_id': key },
+            { '$set': { 'status': 'done', 'response': { 'statusCode': statusCode, 'contentType': contentType, 'body': body }, 'datetime': datetime.now() } },
+        )
+
+    async def release( self, key ):
+        '''
+            Delete pending key so retry run request again
+            NOTE: used when request fail with server error
+            Input: idempotency key (str)
+        '''
+
+        await self.db[self.collectionName].delete_one( { '_id': key, 'status': 'pending' } )
+
+##############################################################
+#
+#   Idempotency Middleware
+#
+
+class IdempotencyMiddleware:
+    '''
+        Replay response of request that is sent again with the same Idempotency-Key header
+        first request is handled and response is saved, retry get saved response without running handler
+        for example:
+            app.add_middleware( IdempotencyMiddleware, store = IdempotencyStore( db ) )
+            POST /request  Idempotency-Key: 6f1c...  => handled, 200
+            POST /request  Idempotency-Key: 6f1c...  => replayed, 200, Idempotent-Replayed: true
+        NOTE: response with status 5xx is not saved so retry run handler again
+        NOTE: request without header is handled as usual
+    '''
+
+    def __init__( self, app, store ):
+        '''
+            Input: ASGI app, idempotency store (IdempotencyStore)
+        '''
+
+        self.app = app
+        self.store = store
+
+    async def __call__( self, scope, receive, send ):
+        if scope['type'] != 'http' or scope['method'] not in IDEMPOTENT_METHODS:
+            return await self.app( scope, receive, send )
+
+        key = dict( scope['headers'] ).get( IDEMPOTENCY_HEADER )
+        if key is None:
+            return await self.app( scope, receive, send )
+
+        key = key.decode( 'latin-1' ).strip()
+        if not key or len( key ) > IDEMPOTENCY_KEY_LENGTH:
+            return await self.respond( send, 400, { 'detail': 'Idempotency key is invalid' } )
+
+        # read body to make fingerprint then give the same body to handler
+        body = await self.read_body( receive )
+        fingerprint = self.store.fingerprint( scope['method'], scope['path'], scope.get( 'query_string', b'' ), body )
+
+        existing = await self.store.begin( key, fingerprint )
+        if existing:
+            if existing['fingerprint'] != fingerprint:
+                return await self.respond( send, 422, { 'detail': 'Idempotency key is already used by other request' } )
+            if existing['status'] != 'done':
+                return await self.respond( send, 409, { 'detail': 'Request with idempotency key is in progress' } )
+
+            response = existing['response']
+            return await self.respond( send, response['statusCode'], bytes( response['body'] ), response['contentType'], replayed = True )
+
+        # run handler and keep response
+        statusCode, contentType, chunks = 500, None, list()
+        bodySent = False
+
+        async def replay():
+            nonlocal bodySent
+            if bodySent:
+                return await receive()
+            bodySent = True
+            return { 'type': 'http.request', 'body': body, 'more_body': False }
+
+        async def capture( message ):
+            nonlocal statusCode, contentType
+            if message['type'] == 'http.response.start':
+                statusCode = message['status']
+                contentType = dict( message.get( 'headers', [] ) ).get( b'content-type', b'' ).decode( 'latin-1' ) or None
+            elif message['type'] == 'http.response.body':
+                chunks.append( message.get( 'body', b'' ) )
+            await send( message )
+
+        try:
+            await self.app( scope, replay, capture )
+        except Exception:
+            await self.store.release( key )
+            raise
+
+        if statusCode >= 500:
+            await self.store.release( key )
+        else:
+            await self.store.complete( key, statusCode, contentType, b''.join( chunks ) )
+
+    @staticmethod
+    async def read_body( receive ):
+        '''
+            Read every chunk of request body
+            Input: ASGI receive
+            Output: body (bytes)
+        '''
+
+        chunks = list()
+        while True:
+            message = await receive()
+            chunks.append( message.get( 'body', b'' ) )
+            if not message.get( 'more_body' ):
+                return b''.join( chunks )
+
+    @staticmethod
+    async def respond( send, statusCode, body, contentType = 'application/json', replayed = False ):
+        '''
+            Send response without running handler
+            Input: ASGI send, status code (int), body (dict or bytes), content type (str), response is replayed (bool)
+        '''
+
+        if isinstance( body, dict ):
+            body = json.dumps( body ).encode()
+
+        headers = [ ( b'content-length', str( len( body ) ).encode() ) ]
+        if contentType:
+            headers.append( ( b'content-type', contentType.encode( 'latin-1' ) ) )
+        if replayed:
+            headers.append( ( b'idempotent-replayed', b'true' ) )
+
+        await send( { 'type': 'http.response.start', 'status': statusCode, 'headers': headers } )
+        await send( { 'type': 'http.response.body', 'body': body } )
@@ -0,0 +1,229 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import sys
+import asyncio
+import argparse
+from pymongo import AsyncMongoClient, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+from mongo import mongo_uri
+from idempotency import IDEMPOTENCY_TTL
+
+##############################################################
+#
+#   Config
+#
+
+# seconds that notification is kept in inbox after it is read
+INBOX_READ_TTL = int( os.getenv( 'INBOX_READ_TTL', 30 * 24 * 60 * 60 ) )
+
+# seconds that cache invalidation is kept for worker that watch it
+CACHE_INVALIDATION_TTL = int( os.getenv( 'CACHE_INVALIDATION_TTL', 60 * 60 ) )
+
+##############################################################
+#
+#   Index Registry
+#
+
+# index spec of every collection
+# NOTE: name is used to match existing index when verify
+INDEXES = {
+    'Users': [
+        { 'name': 'userId_unique', 'keys': [ ( 'userId', ASCENDING ) ], 'unique': True },
+        { 'name': 'email_unique', 'keys': [ ( 'email', ASCENDING ) ], 'unique': True },
+        { 'name': 'userCode_unique', 'keys': [ ( 'userCode', ASCENDING ) ], 'unique': True },
+    ],
+    'Memberships': [
+        # NOTE: lock list of user and role of user in lock use prefix of this index
+        { 'name': 'userId_lockId_unique', 'keys': [ ( 'userId', ASCENDING ), ( 'lockId', ASCENDING ) ], 'unique': True },
+        { 'name': 'lockId_role_datetime', 'keys': [ ( 'lockId', ASCENDING ), ( 'role', ASCENDING ), ( 'datetime', ASCENDING ) ] },
+        { 'name': 'userId_lockLocation', 'keys': [ ( 'userId', ASCENDING ), ( 'lockLocation', ASCENDING ) ] },
+        { 'name': 'guest_expireDatetime', 'keys': [ ( 'expireDatetime', ASCENDING ) ], 'partialFilterExpression': { 'role': 'guest' } },
+    ],
+    'Locks': [
+        { 'name': 'lockId_unique', 'keys': [ ( 'lockId', ASCENDING ) ], 'unique': True },
+        { 'name': 'deleted_tombstone', 'keys': [ ( 'deleted', ASCENDING ) ], 'partialFilterExpression': { 'deleted': True } },
+    ],
+    'Request': [
+        { 'name': 'reqId_unique', 'keys': [ ( 'reqId', ASCENDING ) ], 'unique': True },
+        { 'name': 'lockId_requestStatus_datetime', 'keys': [ ( 'lockId', ASCENDING ), ( 'requestStatus', ASCENDING ), ( 'datetime', DESCENDING ) ] },
+        { 'name': 'userId_lockId', 'keys': [ ( 'userId', ASCENDING ), ( 'lockId', ASCENDING ) ] },
+        # NOTE: user has at most one pending request to lock, request that is accepted or declined is not checked
+        { 'name': 'userId_lockId_sent_unique', 'keys': [ ( 'userId', ASCENDING ), ( 'lockId', ASCENDING ) ], 'unique': True, 'partialFilterExpression': { 'requestStatus': 'sent' } },
+    ],
+    'Invitation': [
+        { 'name': 'invId_unique', 'keys': [ ( 'invId', ASCENDING ) ], 'unique': True },
+        { 'name': 'desUserId_lockId_role_invStatus', 'keys': [ ( 'desUserId', ASCENDING ), ( 'lockId', ASCENDING ), ( 'role', ASCENDING ), ( 'invStatus', ASCENDING ) ] },
+        # NOTE: user has at most one pending invitation of each role to lock
+        { 'name': 'desUserId_lockId_role_invite_unique', 'keys': [ ( 'desUserId', ASCENDING ), ( 'lockId', ASCENDING ), ( 'role', ASCENDING ) ], 'unique': True, 'partialFilterExpression': { 'invStatus': 'invite' } },
+    ],
+    'Other': [
+        { 'name': 'otherId_unique', 'keys': [ ( 'otherId', ASCENDING ) ], 'unique': True },
+        { 'name': 'userId_lockId_subMode', 'keys': [ ( 'userId', ASCENDING ), ( 'lockId', ASCENDING ), ( 'subMode', ASCENDING ) ] },
+    ],
+    'History': [
+        { 'name': 'hisId_unique', 'keys': [ ( 'hisId', ASCENDING ) ], 'unique': True },
+        { 'name': 'lockId_datetime_hisId', 'keys': [ ( 'lockId', ASCENDING ), ( 'datetime', DESCENDING ), ( 'hisId', DESCENDING ) ] },
+        { 'name': 'lockId_status_datetime_hisId', 'keys': [ ( 'lockId', ASCENDING ), ( 'status', ASCENDING ), ( 'datetime', DESCENDING ), ( 'hisId', DESCENDING ) ] },
+    ],
+    'Connect': [
+        { 'name': 'conId_unique', 'keys': [ ( 'conId', ASCENDING ) ], 'unique': True },
+        { 'name': 'lockId_datetime', 'keys': [ ( 'lockId', ASCENDING ), ( 'datetime', DESCENDING ) ] },
+    ],
+    'Warning': [
+        { 'name': 'warningId_unique', 'keys': [ ( 'warningId', ASCENDING ) ], 'unique': True },
+        { 'name': 'lockId_datetime', 'keys': [ ( 'lockId', ASCENDING ), ( 'datetime', DESCENDING ) ] },
+    ],
+    'LockEvents': [
+        { 'name': 'lockId_day', 'keys': [ ( 'lockId', ASCENDING ), ( 'day', DESCENDING ) ] },
+    ],
+    'Inbox': [
+        { 'name': 'inboxId_unique', 'keys': [ ( 'inboxId', ASCENDING ) ], 'unique': True },
+        { 'name': 'userId_datetime_inboxId', 'keys': [ ( 'userId', ASCENDING ), ( 'datetime', DESCENDING ), ( 'inboxId', DESCENDING ) ] },
+        { 'name': 'refId', 'keys': [ ( 'refId', ASCENDING ) ] },
+        # NOTE: only notification that is read is expired so unread counter is not changed
+        { 'name': 'readDatetime_ttl', 'keys': [ ( 'readDatetime', ASCENDING ) ], 'expireAfterSeconds': INBOX_READ_TTL, 'partialFilterExpression': { 'isRead': True } },
+    ],
+    'InboxCounter': [
+        { 'name': 'userId_unique', 'keys': [ ( 'userId', ASCENDING ) ], 'unique': True },
+    ],
+    'CacheInvalidation': [
+        { 'name': 'datetime_ttl', 'keys': [ ( 'datetime', ASCENDING ) ], 'expireAfterSeconds': CACHE_INVALIDATION_TTL },
+    ],
+    'IdempotencyKeys': [
+        # NOTE: key is looked up by _id, this index only expire saved response
+        { 'name': 'datetime_ttl', 'keys': [ ( 'datetime', ASCENDING ) ], 'expireAfterSeconds': IDEMPOTENCY_TTL },
+    ],
+}
+
+# options of index that must match with spec
+INDEX_OPTIONS = [ 'unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds' ]
+
+##############################################################
+#
+#   Helper Functions
+#
+
+def index_options( spec ):
+    '''
+        Get options of index spec
+        Input: index spec (dict)
+        Output: dict of options
+        for example: { 'unique': True }
+    '''
+
+    return { option: spec[option] for option in INDEX_OPTIONS if option in spec }
+
+async def ensure_indexes( db ):
+    '''
+        Create every index in registry if not exists
+        create_index is idempotent when index is already exists with same spec
+        Input: database
+        Output: list of error message (list)
+    '''
+
+    errors = list()
+
+    for collectionName, specs in INDEXES.items():
+        for spec in specs:
+            try:
+                await db[collectionName].create_index( spec['keys'], name = spec['name'], **index_options( spec ) )
+            except PyMongoError as e:
+                # NOTE: do not stop other index when one index is fail e.g. duplicate key of unique index
+                errors.append( f"{collectionName}.{spec['name']}: {e}" )
+
+    return errors
+
+async def verify_indexes( db ):
+    '''
+        Compare existing index with registry
+        Input: database
+        Output: list of drift (list)
+        for example:
+        [
+            { 'collection': 'Users', 'index': 'email_unique', 'drift': 'missing' },
+            { 'collection': 'Locks', 'index': 'lockId_1', 'drift': 'unexpected' },
+        ]
+    '''
+
+    driftList = list()
+
+    for collectionName, specs in INDEXES.items():
+        existing = await db[collectionName].index_information()
+
+        for spec in specs:
+            index = existing.get( spec['name'] )
+
+            # in case index is not exists
+            if not index:
+                driftList.append( { 'collection': collectionName, 'index': spec['name'], 'drift': 'missing' } )
+                continue
+
+            # in case keys is not match
+            if [ ( key, int( direction ) ) for key, direction in index['key'] ] != list( spec['keys'] ):
+                driftList.append( { 'collection': collectionName, 'index': spec['name'], 'drift': 'keys', 'expected': spec['keys'], 'actual': index['key'] } )
+
+            # in case options is not match
+            actualOptions = { option: index[option] for option in INDEX_OPTIONS if option in index }
+            if actualOptions != index_options( spec ):
+                driftList.append( { 'collection': collectionName, 'index': spec['name'], 'drift': 'options', 'expected': index_options( spec ), 'actual': actualOptions } )
+
+        # index that is not in registry
+        names = [ spec['name'] for spec in specs ]
+        for name in existing:
+            if name != '_id_' and name not in names:
+                driftList.append( { 'collection': collectionName, 'index': name, 'drift': 'unexpected' } )
+
+    return driftList
+
+##############################################################
+#
+#   CLI
+#
+
+async def run( command ):
+    '''
+        Run command of CLI
+        Input: command (str) ensure or verify
+        Output: exit code (int)
+    '''
+
+    # connect to database
+    load_dotenv( '.env' )
+    client = AsyncMongoClient( mongo_uri() )
+    db = client[os.getenv( 'MONGO_DB' )]
+
+    try:
+        if command == 'ensure':
+            errors = await ensure_indexes( db )
+            for error in errors:
+                print( error )
+            return 1 if errors else 0
+
+        driftList = await verify_indexes( db )
+        for drift in driftList:
+            print( drift )
+        if not driftList:
+            print( 'Indexes match registry' )
+        return 1 if driftList else 0
+    finally:
+        await client.close()
+
+def main():
+    '''
+        python indexes.py ensure => create every index in registry
+        python indexes.py verify => report drift and exit with code 1 if found
+    '''
+
+    parser = argparse.ArgumentParser( description = 'Create or verify MongoDB indexes' )
+    parser.add_argument( 'command', choices = [ 'ensure', 'verify' ] )
+    args = parser.parse_args()
+
+    return asyncio.run( run( args.command ) )
+
+if __name__ == '__main__':
+    sys.exit( main() )
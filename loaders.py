@@ -0,0 +1,119 @@
+##############################################################
+#
+#   import section
+#
+
+##############################################################
+#
+#   User Loader
+#
+
+class UserLoader:
+    '''
+        Request-scoped loader of user by userId
+        handler add every userId it needs then all of them are fetched by one $in query
+        repeated userId is fetched only once
+        user that is in profile cache is not fetched
+        for example:
+            loader = UserLoader( db, profileCache )
+            loader.add( memberships.user_ids( lockId, [ 'admin', 'member' ] ) )
+            user = await loader.get( 'js7694' )
+    '''
+
+    # field of user that is used to render user in list
+    PROJECTION = { '_id': 0, 'userId': 1, 'userCode': 1, 'firstName': 1, 'lastName': 1, 'userImage': 1 }
+
+    def __init__( self, db, cache = None ):
+        '''
+            Input: database, profile cache (CacheBackend)(optional)
+        '''
+
+        self.db = db
+        self.cache = cache
+
+        # userId that is waiting to fetch
+        self.pending = set()
+
+        # userId -> user (dict) or None if user not found
+        self.users = dict()
+
+        # lockId -> ( set of userId that is checked, set of userId that is waiting for removal )
+        self.removals = dict()
+
+    def add( self, userIds ):
+        '''
+            Add userId to fetch in next load
+            Input: list of userId (list)
+        '''
+
+        for userId in userIds:
+            if userId not in self.users:
+                self.pending.add( userId )
+
+    async def load( self ):
+        '''
+            Fetch every pending user by one $in query
+        '''
+
+        if not self.pending:
+            return
+
+        # connect to database
+        userCollection = self.db['Users']
+
+        userIds = list( self.pending )
+        self.pending = set()
+
+        # get user from cache
+        if self.cache is not None:
+            self.users.update( self.cache.get_many( userIds ) )
+            userIds = [ userId for userId in userIds if userId not in self.users ]
+            if not userIds:
+                return
+
+        # set None for user that is not found
+        for userId in userIds:
+            self.users[userId] = None
+
+        async for user in userCollection.find( { 'userId': { '$in': userIds } }, self.PROJECTION ):
+            self.users[user['userId']] = user
+
+        # NOTE: user that is not found is cached too, signup invalidate it
+        if self.cache is not None:
+            for userId in userIds:
+                self.cache.set( userId, self.users[userId] )
+
+    async def get( self, userId ):
+        '''
+            Get user by userId
+            Input: userId (str)
+            Output: user (dict) or None if user not found
+        '''
+
+        if userId not in self.users:
+            self.pending.add( userId )
+        await self.load()
+
+        return self.users[userId]
+
+    async def is_waiting_for_removal( self, lockId, userId ):
+        '''
+            Check if user is waiting for removal from lock
+            removal of every user that is added is fetched by one $in query per lock
+            Input: lockId (str), userId (str)
+            Output: True or False
+        '''
+
+        # set of userId that is already checked and set of userId that is waiting for removal
+        checkedIds, removalIds = self.removals.get( lockId, ( set(), set() ) )
+
+        if userId not in checkedIds:
+            # connect to database
+            otherCollection = self.db['Other']
+
+            userIds = ( set( self.users ) | self.pending | { userId } ) - checkedIds
+            removalIds |= { other['userId'] async for other in otherCollection.find( { 'userId': { '$in': list( userIds ) }, 'lockId': lockId, 'subMode': 'removal' }, { '_id': 0, 'userId': 1 } ) }
+            checkedIds |= userIds
+            self.removals[lockId] = ( checkedIds, removalIds )
+
+        return userId in removalIds
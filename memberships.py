@@ -0,0 +1,269 @@
+##############################################################
+#
+#   import section
+#
+
+from datetime import datetime
+from pymongo import UpdateOne, ReplaceOne
+from database import Membership
+
+##############################################################
+#
+#   Membership Store
+#
+
+class MembershipStore:
+    '''
+        Role of user in lock with personal lock name, location and image of user
+        one document per ( userId, lockId ) so role lookup, roster of lock and lock list of user
+        are each one indexed query
+        membership document:
+        {
+            'userId': 'js7694',
+            'lockId': '12345',
+            'role': 'guest',
+            'lockName': 'Front Door',
+            'lockLocation': 'Home',
+            'lockImage': None,
+            'expireDatetime': datetime( 2024, 10, 25, 18, 0 ),
+            'datetime': datetime( 2024, 10, 24, 9, 30 )
+        }
+        NOTE: expireDatetime is None for admin and member
+        NOTE: version of user and lock is bumped by every change of membership when version store is given
+    '''
+
+    # field of membership that is returned
+    PROJECTION = { '_id': 0 }
+
+    def __init__( self, db, collectionName = 'Memberships', versions = None ):
+        '''
+            Input: database, name of membership collection (str), version store (VersionStore)(optional)
+        '''
+
+        self.db = db
+        self.collectionName = collectionName
+        self.versions = versions
+
+    @staticmethod
+    def active_query( query = None ):
+        '''
+            Get filter of membership that is not expired
+            Input: filter (dict)(optional)
+            Output: filter (dict)
+        '''
+
+        return { **( query or {} ), '$or': [ { 'expireDatetime': None }, { 'expireDatetime': { '$gt': datetime.now() } } ] }
+
+    async def get( self, userId, lockId, includeExpired = False ):
+        '''
+            Get membership of user in lock
+            Input: userId (str), lockId (str), include expired guest (bool)(optional)
+            Output: membership (dict) or None if user is not in lock
+        '''
+
+        query = { 'userId': userId, 'lockId': lockId }
+
+        return await self.db[self.collectionName].find_one( query if includeExpired else self.active_query( query ), self.PROJECTION )
+
+    async def existing( self, pairs ):
+        '''
+            Get pair of user and lock that user is already in lock by one query
+            Input: list of ( userId, lockId ) (list)
+            Output: set of ( userId, lockId ) (set)
+        '''
+
+        pairs = set( pairs )
+        if not pairs:
+            return set()
+
+        # NOTE: query every user and every lock then keep only pair that is asked
+        query = self.active_query( { 'userId': { '$in': list( { userId for userId, _ in pairs } ) }, 'lockId': { '$in': list( { lockId for _, lockId in pairs } ) } } )
+
+        return { ( membership['userId'], membership['lockId'] ) async for membership in self.db[self.collectionName].find( query, { '_id': 0, 'userId': 1, 'lockId': 1 } ) } & pairs
+
+    async def role( self, userId, lockId ):
+        '''
+            Get role of user in lock
+            Input: userId (str), lockId (str)
+            Output: role (str) admin, member, guest or None if user is not in lock
+        '''
+
+        membership = await self.get( userId, lockId )
+
+        return membership['role'] if membership else None
+
+    async def roster( self, lockId, roles = None ):
+        '''
+            Get membership of every user in lock order by date time that user join
+            Input: lockId (str), list of role (list)(optional)
+            Output: list of membership (list)
+        '''
+
+        query = { 'lockId': lockId }
+        if roles:
+            query['role'] = { '$in': roles }
+
+        return await self.db[self.collectionName].find( self.active_query( query ), self.PROJECTION ).sort( 'datetime', 1 ).to_list()
+
+    async def user_ids( self, lockId, roles = None ):
+        '''
+            Get userId of every user in lock
+            Input: lockId (str), list of role (list)(optional)
+            Output: list of userId (list)
+        '''
+
+        return [ membership['userId'] for membership in await self.roster( lockId, roles ) ]
+
+    async def user_ids_of_locks( self, lockIds, roles = None ):
+        '''
+            Get userId of every user in every lock by one query
+            Input: list of lockId (list), list of role (list)(optional)
+            Output: dict of lockId and list of userId (dict)
+        '''
+
+        query = { 'lockId': { '$in': list( lockIds ) } }
+        if roles:
+            query['role'] = { '$in': roles }
+
+        userIds = { lockId: [] for lockId in lockIds }
+        async for membership in self.db[self.collectionName].find( self.active_query( query ), { '_id': 0, 'userId': 1, 'lockId': 1 } ).sort( 'datetime', 1 ):
+            userIds[membership['lockId']].append( membership['userId'] )
+
+        return userIds
+
+    async def locks_of( self, userId, roles = None ):
+        '''
+            Get membership of every lock of user order by date time that user join
+            Input: userId (str), list of role (list)(optional)
+            Output: list of membership (list)
+        '''
+
+        query = { 'userId': userId }
+        if roles:
+            query['role'] = { '$in': roles }
+
+        return await self.db[self.collectionName].find( self.active_query( query ), self.PROJECTION ).sort( 'datetime', 1 ).to_list()
+
+    async def add( self, userId, lockId, role, lockName, lockLocation, lockImage = None, expireDatetime = None ):
+        '''
+            Add user to lock
+            NOTE: membership of the same user and lock is replaced, e.g. guest that is expired but not deleted yet
+                  caller must check that user is not in lock before
+            Input: userId (str), lockId (str), role (str), lockName (str), lockLocation (str), lockImage (str)(optional), expire datetime (datetime)(optional)
+            Output: membership (dict)
+        '''
+
+        membership = Membership(
+            userId = userId,
+            lockId = lockId,
+            role = role,
+            lockName = lockName,
+            lockLocation = lockLocation,
+            lockImage = lockImage,
+            expireDatetime = expireDatetime,
+            datetime = datetime.now(),
+        ).dict()
+        await self.db[self.collectionName].replace_one( { 'userId': userId, 'lockId': lockId }, dict( membership ), upsert = True )
+
+        if self.versions:
+            await self.versions.bump( [ userId ], [ lockId ] )
+
+        return membership
+
+    async def add_many( self, entries ):
+        '''
+            Add many user to lock by one bulk write
+            NOTE: same as add, caller must check that user is not in lock before
+            Input: list of dict of argument of add (list)
+            for example: [ { 'userId': 'tw8769', 'lockId': '12345', 'role': 'guest', 'lockName': 'Front Door', 'lockLocation': 'Home', 'expireDatetime': datetime( 2024, 10, 25, 18, 0 ) } ]
+            Output: list of membership (list)
+        '''
+
+        memberships = [
+            Membership(
+                userId = entry['userId'],
+                lockId = entry['lockId'],
+                role = entry['role'],
+                lockName = entry['lockName'],
+                lockLocation = entry['lockLocation'],
+                lockImage = entry.get( 'lockImage' ),
+                expireDatetime = entry.get( 'expireDatetime' ),
+                datetime = datetime.now(),
+            ).dict()
+            for entry in entries
+        ]
+        if not memberships:
+            return memberships
+
+        await self.db[self.collectionName].bulk_write( [
+            ReplaceOne( { 'userId': membership['userId'], 'lockId': membership['lockId'] }, dict( membership ), upsert = True )
+            for membership in memberships
+        ], ordered = False )
+
+        if self.versions:
+            await self.versions.bump( [ membership['userId'] for membership in memberships ], [ membership['lockId'] for membership in memberships ] )
+
+        return memberships
+
+    async def update( self, userId, lockId, fields ):
+        '''
+            Update field of membership
+            Input: userId (str), lockId (str), dict of field
+            Output: True if membership is found
+        '''
+
+        matched = ( await self.db[self.collectionName].update_one( { 'userId': userId, 'lockId': lockId }, { '$set': fields } ) ).matched_count > 0
+
+        if matched and self.versions:
+            await self.versions.bump( [ userId ], [ lockId ] )
+
+        return matched
+
+    async def remove( self, query ):
+        '''
+            Delete every membership that match with query
+            delete location of removed lock from lock location list of user when no other lock of user use it
+            Input: filter of membership (dict)
+            Output: list of membership that is deleted (list)
+        '''
+
+        memberships = await self.db[self.collectionName].find( query ).to_list()
+        if not memberships:
+            return memberships
+
+        await self.db[self.collectionName].delete_many( { '_id': { '$in': [ membership['_id'] for membership in memberships ] } } )
+
+        # get location of removed lock of every user
+        removedLocations = dict()
+        for membership in memberships:
+            removedLocations.setdefault( membership['userId'], set() ).add( membership['lockLocation'] )
+
+        # get location that is still used by other lock of user by one query
+        usedLocations = { userId: set() for userId in removedLocations }
+        async for membership in self.db[self.collectionName].find( { 'userId': { '$in': list( removedLocations ) }, 'lockLocation': { '$in': list( set().union( *removedLocations.values() ) ) } }, { '_id': 0, 'userId': 1, 'lockLocation': 1 } ):
+            usedLocations[membership['userId']].add( membership['lockLocation'] )
+
+        # delete location that is not in use from lock location list
+        userOperations = [
+            UpdateOne( { 'userId': userId }, { '$pull': { 'lockLocationList': { '$in': list( locations - usedLocations[userId] ) } } } )
+            for userId, locations in removedLocations.items() if locations - usedLocations[userId]
+        ]
+        if userOperations:
+            await self.db['Users'].bulk_write( userOperations, ordered = False )
+
+        if self.versions:
+            await self.versions.bump( removedLocations, { membership['lockId'] for membership in memberships } )
+
+        for membership in memberships:
+            membership.pop( '_id' )
+
+        return memberships
+
+    async def location_in_use( self, userId, lockLocation ):
+        '''
+            Check if any lock of user use location
+            Input: userId (str), lockLocation (str)
+            Output: True or False
+        '''
+
+        return await self.db[self.collectionName].find_one( { 'userId': userId, 'lockLocation': lockLocation }, { '_id': 1 } ) is not None
@@ -0,0 +1,239 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import time
+from datetime import datetime
+
+##############################################################
+#
+#   Config
+#
+
+# size of batch that is read and rewritten at once
+# NOTE: size of document is given by migration e.g. lock count as number of its event, other document count as 1
+MIGRATION_BATCH_SIZE = int( os.getenv( 'MIGRATION_BATCH_SIZE', 500 ) )
+
+# seconds to sleep between batch so migration does not starve the API
+MIGRATION_BATCH_SLEEP = float( os.getenv( 'MIGRATION_BATCH_SLEEP', 0.2 ) )
+
+# collection that keep checkpoint of every migration and schema version of every collection
+MIGRATION_COLLECTION = 'Migrations'
+
+# schema version of document that is written by current code
+# NOTE: must match the highest version of migration of collection
+SCHEMA_VERSION = {
+    'Locks': 2,
+    'Users': 2,
+}
+
+##############################################################
+#
+#   Migration
+#
+
+class Migration:
+    '''
+        Base class of versioned migration
+        migration rewrite every document of collection that schemaVersion is lower than version
+        subclass implement migrate( db, documents ) => { collectionName: list of write operation }
+        write operation of collection itself must set schemaVersion of document to version
+    '''
+
+    # schema version of collection after migration
+    version = 0
+
+    # collection that is migrated
+    collectionName = ''
+
+    # short description of migration
+    description = ''
+
+    def query( self ):
+        '''
+            Get filter of document that is not migrated yet
+            Output: filter (dict)
+        '''
+
+        return { 'schemaVersion': { '$not': { '$gte': self.version } } }
+
+    def size( self, document ):
+        '''
+            Get size of document in batch
+            batch is closed when size of its document reach batch size
+            Input: document (dict)
+            Output: size (int)
+        '''
+
+        return 1
+
+    def migrate( self, db, documents ):
+        '''
+            Get write operation that migrate batch of document
+            Input: database, list of document (list)
+            Output: dict of collection name and list of write operation
+        '''
+
+        raise NotImplementedError
+
+##############################################################
+#
+#   Helper Functions
+#
+
+def schema_version( document ):
+    '''
+        Get schema version of document
+        document that is created before migration framework has version 1
+        Input: document (dict)
+        Output: version (int)
+    '''
+
+    return ( document or {} ).get( 'schemaVersion', 1 )
+
+def get_migrations():
+    '''
+        Get every migration order by version
+        Output: list of Migration (list)
+    '''
+
+    from migrations.m0002_lock_event_buckets import LockEventBuckets
+    from migrations.m0003_memberships import UserMemberships
+
+    return sorted( [ LockEventBuckets(), UserMemberships() ], key = lambda migration: ( migration.collectionName, migration.version ) )
+
+def get_status( db ):
+    '''
+        Get status of every migration
+        Input: database
+        Output: list of status (list)
+        for example:
+        [
+            { 'collection': 'Locks', 'version': 2, 'description': 'Move event id list into bucket', 'done': False, 'processed': 1500, 'pending': 320 },
+        ]
+    '''
+
+    # connect to database
+    migrationCollection = db[MIGRATION_COLLECTION]
+
+    statusList = list()
+    for migration in get_migrations():
+        checkpoint = migrationCollection.find_one( { '_id': f'{migration.collectionName}:{migration.version}' } ) or {}
+        statusList.append( {
+            'collection': migration.collectionName,
+            'version': migration.version,
+            'description': migration.description,
+            'done': checkpoint.get( 'done', False ),
+            'processed': checkpoint.get( 'processed', 0 ),
+            'pending': db[migration.collectionName].count_documents( migration.query() ),
+        } )
+
+    return statusList
+
+def run_migration( db, migration, dryRun = False, batchSize = MIGRATION_BATCH_SIZE, sleep = MIGRATION_BATCH_SLEEP, log = print ):
+    '''
+        Run one migration in batch until every document is migrated
+        checkpoint is saved after every batch so migration continue from last document when it is run again
+        in dry run, nothing is written and amount of write operation is counted instead
+        Input: database, Migration, dry run (bool), batch size (int) by size of document, seconds between batch (float), log function
+        Output: dict of report
+        for example:
+        {
+            'collection': 'Locks',
+            'version': 2,
+            'dryRun': True,
+            'batches': 4,
+            'documents': 1820,
+            'operations': { 'LockEvents': 40210, 'Locks': 1820 },
+            'seconds': 12.5
+        }
+    '''
+
+    # connect to database
+    migrationCollection = db[MIGRATION_COLLECTION]
+    collection = db[migration.collectionName]
+
+    checkpointId = f'{migration.collectionName}:{migration.version}'
+    checkpoint = migrationCollection.find_one( { '_id': checkpointId } ) or {}
+
+    report = {
+        'collection': migration.collectionName,
+        'version': migration.version,
+        'dryRun': dryRun,
+        'batches': 0,
+        'documents': 0,
+        'operations': dict(),
+        'seconds': 0,
+    }
+
+    if checkpoint.get( 'done' ):
+        return report
+
+    if not dryRun:
+        migrationCollection.update_one( { '_id': checkpointId }, { '$setOnInsert': { 'startedDatetime': datetime.now(), 'processed': 0 } }, upsert = True )
+
+    # NOTE: dry run start from first document because nothing is written
+    lastId = None if dryRun else checkpoint.get( 'lastId' )
+    startTime = time.monotonic()
+
+    while True:
+        query = migration.query()
+        if lastId is not None:
+            query = { '$and': [ query, { '_id': { '$gt': lastId } } ] }
+
+        # read document until size of batch is reached
+        # NOTE: batch has at least one document even if its size is over batch size
+        documents, size = list(), 0
+        cursor = collection.find( query ).sort( '_id', 1 ).limit( batchSize )
+        for document in cursor:
+            documents.append( document )
+            size += migration.size( document )
+            if size >= batchSize:
+                break
+        cursor.close()
+
+        if not documents:
+            break
+
+        batchTime = time.monotonic()
+        operations = migration.migrate( db, documents )
+
+        for collectionName, writes in operations.items():
+            report['operations'][collectionName] = report['operations'].get( collectionName, 0 ) + len( writes )
+            if writes and not dryRun:
+                db[collectionName].bulk_write( writes )
+
+        lastId = documents[-1]['_id']
+        report['batches'] += 1
+        report['documents'] += len( documents )
+
+        # save checkpoint of batch
+        if not dryRun:
+            migrationCollection.update_one( { '_id': checkpointId }, { '$set': { 'lastId': lastId }, '$inc': { 'processed': len( documents ) } } )
+
+        log( f"{checkpointId} batch {report['batches']}: {len( documents )} documents in {time.monotonic() - batchTime:.2f}s" )
+
+        # throttle between batch
+        if sleep:
+            time.sleep( sleep )
+
+    report['seconds'] = round( time.monotonic() - startTime, 2 )
+
+    if not dryRun:
+        migrationCollection.update_one( { '_id': checkpointId }, { '$set': { 'done': True, 'finishedDatetime': datetime.now() } } )
+
+        # mark schema version of collection
+        migrationCollection.update_one( { '_id': 'schemaVersion' }, { '$max': { migration.collectionName: migration.version } }, upsert = True )
+
+    return report
+
+def run_migrations( db, dryRun = False, batchSize = MIGRATION_BATCH_SIZE, sleep = MIGRATION_BATCH_SLEEP, log = print ):
+    '''
+        Run every migration that is not done order by version
+        Input: database, dry run (bool), batch size (int), seconds between batch (float), log function
+        Output: list of report (list)
+    '''
+
+    return [ run_migration( db, migration, dryRun, batchSize, sleep, log ) for migration in get_migrations() ]
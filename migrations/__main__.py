@@ -0,0 +1,68 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import sys
+import argparse
+from pymongo import MongoClient
+from dotenv import load_dotenv
+from mongo import mongo_uri
+from migrations import get_status, run_migrations, MIGRATION_BATCH_SIZE, MIGRATION_BATCH_SLEEP
+
+##############################################################
+#
+#   CLI
+#
+
+def get_database( uri ):
+    '''
+        Connect to database by uri
+        uri = mongomock:// use in-memory database for testing (mongomock must be installed)
+        Input: uri (str) or None to use MONGO_URI or Atlas cluster from .env
+        Output: database
+    '''
+
+    load_dotenv( '.env' )
+    dbName = os.getenv( 'MONGO_DB' ) or 'test'
+
+    if uri and uri.startswith( 'mongomock://' ):
+        import mongomock
+        return mongomock.MongoClient()[dbName]
+
+    if not uri:
+        uri = mongo_uri()
+
+    return MongoClient( uri )[dbName]
+
+def main():
+    '''
+        python -m migrations status => show every migration and amount of document that is not migrated
+        python -m migrations run --dry-run => count write operation and time without writing
+        python -m migrations run => run every migration that is not done
+        --uri mongodb://localhost:27017 => run against local mongod
+    '''
+
+    parser = argparse.ArgumentParser( description = 'Run schema migration of MongoDB documents' )
+    parser.add_argument( 'command', choices = [ 'status', 'run' ] )
+    parser.add_argument( '--dry-run', action = 'store_true', help = 'count write operation without writing' )
+    parser.add_argument( '--batch-size', type = int, default = MIGRATION_BATCH_SIZE )
+    parser.add_argument( '--sleep', type = float, default = MIGRATION_BATCH_SLEEP, help = 'seconds between batch' )
+    parser.add_argument( '--uri', default = None, help = 'MongoDB uri, default is cluster from .env' )
+    args = parser.parse_args()
+
+    db = get_database( args.uri )
+
+    if args.command == 'status':
+        for status in get_status( db ):
+            print( status )
+        return 0
+
+    for report in run_migrations( db, args.dry_run, args.batch_size, args.sleep ):
+        print( report )
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit( main() )
@@ -0,0 +1,84 @@
+##############################################################
+#
+#   import section
+#
+
+from pymongo import UpdateOne, DeleteMany
+from migrations import Migration
+from events import LockEventStore
+
+##############################################################
+#
+#   Migration
+#
+
+class LockEventBuckets( Migration ):
+    '''
+        Move history, connect and warning id list out of lock document into bucket of LockEvents
+        lock keep only warningCount, lastWarningDatetime and lastConnectDatetime
+    '''
+
+    version = 2
+    collectionName = 'Locks'
+    description = 'Move history, connect and warning id list of lock into LockEvents bucket'
+
+    def size( self, document ):
+        '''
+            Get size of lock by number of its event so batch load about batch size event
+            NOTE: event that is not in id list is not counted, it is moved with lock anyway
+            Input: lock (dict)
+            Output: size (int)
+        '''
+
+        return max( 1, sum( len( document.get( field ) or [] ) for field in [ 'history', 'connect', 'warning' ] ) )
+
+    def migrate( self, db, documents ):
+        '''
+            Input: database, list of lock (list)
+            Output: dict of collection name and list of write operation
+        '''
+
+        store = LockEventStore( db )
+        lockIds = [ lock['lockId'] for lock in documents ]
+
+        # get event of every lock in batch by one query per collection
+        # NOTE: event is read by lockId so event that is not in id list is moved too
+        histories = list( db['History'].find( { 'lockId': { '$in': lockIds } }, { '_id': 0 } ).sort( 'datetime', 1 ) )
+        connects = list( db['Connect'].find( { 'lockId': { '$in': lockIds } }, { '_id': 0 } ).sort( 'datetime', 1 ) )
+        warnings = list( db['Warning'].find( { 'lockId': { '$in': lockIds } }, { '_id': 0 } ).sort( 'datetime', 1 ) )
+
+        # NOTE: delete bucket of lock first so batch can be run again when it is stopped in the middle
+        eventWrites = [ DeleteMany( { 'lockId': { '$in': lockIds } } ) ]
+        for history in histories:
+            eventWrites.append( store.event_update( history['lockId'], 'history', history['hisId'], history['userId'], history['datetime'], status = history['status'] ) )
+        for connect in connects:
+            eventWrites.append( store.event_update( connect['lockId'], 'connect', connect['conId'], connect['userId'], connect['datetime'] ) )
+
+        # warning that is not in warning list of lock is already ignored
+        activeWarningIds = { lock['lockId']: set( lock.get( 'warning' ) or [] ) for lock in documents }
+        for warning in warnings:
+            fields = { 'message': warning['message'] }
+            if warning['warningId'] not in activeWarningIds[warning['lockId']]:
+                fields['dismissed'] = True
+            eventWrites.append( store.event_update( warning['lockId'], 'warning', warning['warningId'], warning['userId'], warning['datetime'], **fields ) )
+
+        # latest date time of every lock
+        # NOTE: event is sorted by date time so the last one is the latest
+        lastConnectDatetime = { connect['lockId']: connect['datetime'] for connect in connects }
+        lastWarningDatetime = { warning['lockId']: warning['datetime'] for warning in warnings }
+
+        lockWrites = [
+            UpdateOne( { '_id': lock['_id'] }, {
+                '$set': {
+                    'warningCount': len( activeWarningIds[lock['lockId']] ),
+                    'lastWarningDatetime': lastWarningDatetime.get( lock['lockId'] ),
+                    'lastConnectDatetime': lastConnectDatetime.get( lock['lockId'] ),
+                    'schemaVersion': self.version,
+                },
+                '$unset': { 'history': '', 'connect': '', 'warning': '' },
+            } )
+            for lock in documents
+        ]
+
+        # NOTE: bucket is written before lock so lock is marked only when every event is moved
+        return { store.collectionName: eventWrites, self.collectionName: lockWrites }
@@ -0,0 +1,67 @@
+##############################################################
+#
+#   import section
+#
+
+from datetime import datetime
+from pymongo import UpdateOne, UpdateMany
+from migrations import Migration
+from memberships import MembershipStore
+
+##############################################################
+#
+#   Migration
+#
+
+class UserMemberships( Migration ):
+    '''
+        Move admin, member and guest lock list of user into Memberships collection
+        role list of user and lock is deleted after membership is written
+    '''
+
+    version = 2
+    collectionName = 'Users'
+    description = 'Move admin, member and guest lock list of user into Memberships'
+
+    def migrate( self, db, documents ):
+        '''
+            Input: database, list of user (list)
+            Output: dict of collection name and list of write operation
+        '''
+
+        store = MembershipStore( db )
+        now = datetime.now()
+
+        # NOTE: upsert by userId and lockId so batch can be run again when it is stopped in the middle
+        # NOTE: role is written from lowest to highest so the highest role is kept when lock is in more than one list
+        membershipWrites = list()
+        lockIds = set()
+        for user in documents:
+            for role in [ 'guest', 'member', 'admin' ]:
+                for lockDetail in user.get( role ) or []:
+                    lockIds.add( lockDetail['lockId'] )
+                    membershipWrites.append( UpdateOne(
+                        { 'userId': user['userId'], 'lockId': lockDetail['lockId'] },
+                        {
+                            '$set': {
+                                'role': role,
+                                'lockName': lockDetail['lockName'],
+                                'lockLocation': lockDetail['lockLocation'],
+                                'lockImage': lockDetail.get( 'lockImage' ),
+                                'expireDatetime': lockDetail.get( 'expireDatetime' ) if role == 'guest' else None,
+                            },
+                            '$setOnInsert': { 'datetime': now },
+                        },
+                        upsert = True,
+                    ) )
+
+        userWrites = [
+            UpdateOne( { '_id': user['_id'] }, { '$set': { 'schemaVersion': self.version }, '$unset': { 'admin': '', 'member': '', 'guest': '' } } )
+            for user in documents
+        ]
+
+        # role list of lock is not read anymore
+        lockWrites = [ UpdateMany( { 'lockId': { '$in': list( lockIds ) } }, { '$unset': { 'admin': '', 'member': '', 'guest': '' } } ) ] if lockIds else []
+
+        # NOTE: membership is written before user so user is marked only when every membership is moved
+        return { store.collectionName: membershipWrites, self.collectionName: userWrites, 'Locks': lockWrites }
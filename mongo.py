@@ -0,0 +1,328 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import time
+import asyncio
+import threading
+from pymongo import AsyncMongoClient
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.errors import PyMongoError
+from pymongo.write_concern import WriteConcern
+
+##############################################################
+#
+#   Config
+#
+
+def mongo_uri():
+    '''
+        Get uri of database
+        MONGO_URI is used when it is set else uri of Atlas cluster is made from MONGO_USER, MONGO_PASSWORD and MONGO_HOST
+        Output: uri (str)
+    '''
+
+    uri = os.getenv( 'MONGO_URI' )
+    if uri:
+        return uri
+
+    return 'mongodb+srv://%s:%s@%s/' % ( os.getenv( 'MONGO_USER' ), os.getenv( 'MONGO_PASSWORD' ), os.getenv( 'MONGO_HOST', 'cluster0.o068s.mongodb.net' ) )
+
+def mongo_options():
+    '''
+        Get option of AsyncMongoClient from environment
+        NOTE: maxPoolSize is the number of database call that run at the same time in one worker,
+              handler that wait for connection does not hold thread so it can be larger than thread pool
+        Output: dict of option
+    '''
+
+    return {
+        'maxPoolSize': int( os.getenv( 'MONGO_MAX_POOL_SIZE', 100 ) ),
+        'minPoolSize': int( os.getenv( 'MONGO_MIN_POOL_SIZE', 0 ) ),
+        'maxIdleTimeMS': int( os.getenv( 'MONGO_MAX_IDLE_TIME_MS', 5 * 60 * 1000 ) ),
+        'connectTimeoutMS': int( os.getenv( 'MONGO_CONNECT_TIMEOUT_MS', 10000 ) ),
+        'serverSelectionTimeoutMS': int( os.getenv( 'MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000 ) ),
+        'socketTimeoutMS': int( os.getenv( 'MONGO_SOCKET_TIMEOUT_MS', 30000 ) ),
+        'waitQueueTimeoutMS': int( os.getenv( 'MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000 ) ),
+    }
+
+# number of connection that is opened at startup before worker take request
+MONGO_WARM_CONNECTIONS = int( os.getenv( 'MONGO_WARM_CONNECTIONS', 4 ) )
+
+##############################################################
+#
+#   Pool Statistics
+#
+
+class PoolStats( ConnectionPoolListener ):
+    '''
+        Count connection of pool of every server by connection monitoring event of pymongo
+        for example:
+        {
+            'open': 12,
+            'checkedOut': 3,
+            'created': 14,
+            'closed': 2,
+            'checkouts': 15230,
+            'checkoutFailed': 0,
+            'cleared': 0
+        }
+    '''
+
+    def __init__( self ):
+        self.lock = threading.Lock()
+        self.counters = { 'open': 0, 'checkedOut': 0, 'created': 0, 'closed': 0, 'checkouts': 0, 'checkoutFailed': 0, 'cleared': 0 }
+
+    def count( self, **deltas ):
+        '''
+            Add delta to counter
+            Input: counter name and delta (int)
+        '''
+
+        with self.lock:
+            for name, delta in deltas.items():
+                self.counters[name] += delta
+
+    def snapshot( self ):
+        '''
+            Get copy of counter
+            Output: dict of counter
+        '''
+
+        with self.lock:
+            return dict( self.counters )
+
+    def pool_created( self, event ):
+        pass
+
+    def pool_ready( self, event ):
+        pass
+
+    def pool_cleared( self, event ):
+        self.count( cleared = 1 )
+
+    def pool_closed( self, event ):
+        pass
+
+    def connection_created( self, event ):
+        self.count( created = 1, open = 1 )
+
+    def connection_ready( self, event ):
+        pass
+
+    def connection_closed( self, event ):
+        self.count( closed = 1, open = -1 )
+
+    def connection_check_out_started( self, event ):
+        pass
+
+    def connection_check_out_failed( self, event ):
+        self.count( checkoutFailed = 1 )
+
+    def connection_checked_out( self, event ):
+        self.count( checkouts = 1, checkedOut = 1 )
+
+    def connection_checked_in( self, event ):
+        self.count( checkedOut = -1 )
+
+##############################################################
+#
+#   Mongo Manager
+#
+
+class MongoManager:
+    '''
+        Own AsyncMongoClient of worker
+        client is created at startup hook or at first use, not at import, so import of app never wait for database
+        client that is created before fork is not used in child process, child create own client
+        for example:
+            mongo = MongoManager( 'Fido' )
+            db = mongo.database()
+            await mongo.open()    => create client and warm connection at startup
+            await mongo.ping()    => { 'ok': True, 'latencyMs': 1.8 }
+            await mongo.transaction( callback ) => run write of callback in one transaction
+            await mongo.close()   => close client at shutdown
+        NOTE: client is bound to event loop of worker, thread that is not in event loop must not use it
+    '''
+
+    def __init__( self, dbName, uri = None, options = None, warmConnections = MONGO_WARM_CONNECTIONS ):
+        '''
+            Input: name of database (str), uri (str)(optional), option of AsyncMongoClient (dict)(optional), number of connection that is opened at startup (int)
+        '''
+
+        self.dbName = dbName
+        self.uri = uri
+        self.options = options
+        self.warmConnections = warmConnections
+
+        self.client = None
+        self.pid = None
+        self.stats = PoolStats()
+
+        # server of client support transaction or not, None until it is checked
+        self.transactional = None
+        self.lock = threading.Lock()
+
+    def get_client( self ):
+        '''
+            Get client of this process, create it when it is not created yet
+            NOTE: AsyncMongoClient connect at first operation so this does not wait for database
+            Output: AsyncMongoClient
+        '''
+
+        client = self.client
+        if client is not None and self.pid == os.getpid():
+            return client
+
+        with self.lock:
+            if self.client is None or self.pid != os.getpid():
+                # NOTE: client of parent process is left as it is, closing it would close socket of parent
+                self.stats = PoolStats()
+                self.client = AsyncMongoClient( self.uri or mongo_uri(), event_listeners = [ self.stats ], **( self.options or mongo_options() ) )
+                self.pid = os.getpid()
+                self.transactional = None
+
+            return self.client
+
+    def database( self ):
+        '''
+            Get database that connect lazily
+            Output: LazyDatabase
+        '''
+
+        return LazyDatabase( self )
+
+    async def open( self ):
+        '''
+            Create client and open connection before worker take request
+            connection is opened by ping at the same time so cold start pay handshake once
+            NOTE: error is printed, worker still start and /readyz report not ready
+        '''
+
+        client = self.get_client()
+
+        if self.warmConnections <= 0:
+            return
+
+        results = await asyncio.gather( *[ self.ping( client ) for _ in range( self.warmConnections ) ] )
+
+        errors = [ result['error'] for result in results if not result['ok'] ]
+        if errors:
+            print( errors[0] )
+        else:
+            print( 'Connected to database' )
+
+    async def ping( self, client = None ):
+        '''
+            Ping database and measure round trip
+            Input: AsyncMongoClient (optional)
+            Output: dict of result
+            for example: { 'ok': True, 'latencyMs': 1.8 } or { 'ok': False, 'latencyMs': 10003.2, 'error': 'No servers found' }
+        '''
+
+        client = client or self.get_client()
+
+        start = time.perf_counter()
+        try:
+            await client.admin.command( 'ping' )
+            return { 'ok': True, 'latencyMs': round( ( time.perf_counter() - start ) * 1000, 3 ) }
+        except PyMongoError as e:
+            return { 'ok': False, 'latencyMs': round( ( time.perf_counter() - start ) * 1000, 3 ), 'error': str( e ) }
+
+    async def supports_transactions( self ):
+        '''
+            Check if server of client is replica set or sharded cluster that support transaction
+            NOTE: result is checked once per client
+            Output: True or False
+        '''
+
+        client = self.get_client()
+
+        if self.transactional is None:
+            hello = await client.admin.command( 'hello' )
+            self.transactional = bool( hello.get( 'setName' ) or hello.get( 'msg' ) == 'isdbgrid' )
+            if not self.transactional:
+                print( 'Database is standalone server, write without transaction' )
+
+        return self.transactional
+
+    async def transaction( self, callback ):
+        '''
+            Run callback in multi-document transaction
+            write of callback is committed together or not at all
+            for example:
+                async def write( session ):
+                    await db['Request'].insert_one( request, session = session )
+                await mongo.transaction( write )
+            Input: coroutine function that take session (AsyncClientSession)
+            Output: result of callback
+            NOTE: callback is run again on transient error so every write of callback must use session
+            NOTE: transaction need replica set, Atlas cluster is always replica set,
+                  on standalone server e.g. local mongod callback is run once with session None and write is not atomic
+        '''
+
+        if not await self.supports_transactions():
+            return await callback( None )
+
+        async with self.get_client().start_session() as session:
+            return await session.with_transaction( callback, write_concern = WriteConcern( 'majority' ) )
+
+    def pool_stats( self ):
+        '''
+            Get option and counter of connection pool
+            Output: dict of pool statistics
+        '''
+
+        options = self.client.options.pool_options if self.client is not None else None
+
+        return {
+            'connected': self.client is not None and self.pid == os.getpid(),
+            'maxPoolSize': options.max_pool_size if options else None,
+            'minPoolSize': options.min_pool_size if options else None,
+            **self.stats.snapshot(),
+        }
+
+    async def close( self ):
+        '''
+            Close client of this process
+        '''
+
+        with self.lock:
+            client = self.client if self.pid == os.getpid() else None
+            self.client = None
+            self.pid = None
+
+        if client is not None:
+            await client.close()
+
+class LazyDatabase:
+    '''
+        Database that get client from manager at every use
+        store and handler keep this object at import and client is created when it is first used
+        for example:
+            db = mongo.database()
+            await db['Users'].find_one( { 'userId': 'js7694' } )
+    '''
+
+    def __init__( self, manager ):
+        '''
+            Input: mongo manager (MongoManager)
+        '''
+
+        self.manager = manager
+
+    def get( self ):
+        '''
+            Get pymongo database of this process
+            Output: AsyncDatabase
+        '''
+
+        return self.manager.get_client()[self.manager.dbName]
+
+    def __getitem__( self, name ):
+        return self.get()[name]
+
+    def __getattr__( self, name ):
+        return getattr( self.get(), name )
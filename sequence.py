@@ -0,0 +1,165 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import asyncio
+import hashlib
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+##############################################################
+#
+#   Config
+#
+
+# number of sequence values reserved per round trip to the counters collection
+ID_BLOCK_SIZE = int( os.getenv( 'ID_BLOCK_SIZE', 50 ) )
+
+##############################################################
+#
+#   Sequence Allocator
+#
+
+class SequenceAllocator:
+    '''
+        Allocate unique increasing numbers for every id prefix
+        each worker reserves a block of numbers by one atomic $inc on the counters collection
+        and hands them out from memory until the block is used up
+        counter document: { '_id': 'req', 'seq': 150 }
+    '''
+
+    def __init__( self, db, collectionName = 'Counters', blockSize = ID_BLOCK_SIZE ):
+        '''
+            Input: database, name of counters collection (str), block size (int)
+        '''
+
+        self.db = db
+        self.collectionName = collectionName
+        self.blockSize = blockSize
+
+        # name -> [ next number, last number of block ]
+        self.blocks = dict()
+
+        # name of counters that already seeded by this worker
+        self.seeded = set()
+
+        self.lock = asyncio.Lock()
+
+    async def seed( self, name, collectionName, field, prefix ):
+        '''
+            Create counter from the highest id that already exists in collection
+            run only once when counter is not exists
+            Input: counter name (str), collection name (str), id field (str), id prefix (str)
+        '''
+
+        # connect to database
+        counterCollection = self.db[self.collectionName]
+
+        # counter is already exists
+        if await counterCollection.find_one( { '_id': name }, { '_id': 1 } ):
+            return
+
+        # get highest number of existing id
+        # NOTE: one time scan when counter is created
+        result = await ( await self.db[collectionName].aggregate( [
+            { '$match': { field: { '$regex': '^' + prefix + '[0-9]+$' } } },
+            { '$project': { 'number': { '$toLong': { '$substrCP': [ '$' + field, len( prefix ), 32 ] } } } },
+            { '$group': { '_id': None, 'number': { '$max': '$number' } } },
+        ] ) ).to_list()
+        number = result[0]['number'] if result else 0
+
+        # create counter if other worker is not create it yet
+        try:
+            await counterCollection.update_one( { '_id': name }, { '$setOnInsert': { 'seq': number } }, upsert = True )
+        except DuplicateKeyError:
+            pass
+
+    async def reserve( self, name, size ):
+        '''
+            Reserve block of numbers by atomic $inc
+            Input: counter name (str), block size (int)
+            Output: [ first number, last number ] (list)
+        '''
+
+        # connect to database
+        counterCollection = self.db[self.collectionName]
+
+        counter = await counterCollection.find_one_and_update(
+            { '_id': name },
+            { '$inc': { 'seq': size } },
+            upsert = True,
+            return_document = ReturnDocument.AFTER,
+        )
+
+        return [ counter['seq'] - size + 1, counter['seq'] ]
+
+    async def next_number( self, name, size = None ):
+        '''
+            Get next number of counter
+            Input: counter name (str), block size (int)(optional)
+            Output: number (int)
+        '''
+
+        async with self.lock:
+            block = self.blocks.get( name )
+
+            # reserve new block when block is used up
+            if not block or block[0] > block[1]:
+                block = await self.reserve( name, size if size else self.blockSize )
+                self.blocks[name] = block
+
+            number = block[0]
+            block[0] += 1
+
+        return number
+
+    async def next_id( self, prefix, collectionName, field ):
+        '''
+            Generate next id of collection
+            Input: id prefix (str), collection name (str), id field (str)
+            Output: id (str)
+            for example: prefix = 'req' => 'req00001'
+        '''
+
+        # seed counter from existing ids on first use
+        if prefix not in self.seeded:
+            await self.seed( prefix, collectionName, field, prefix )
+            self.seeded.add( prefix )
+
+        return prefix + str( await self.next_number( prefix ) ).zfill( 5 )
+
+##############################################################
+#
+#   Shuffled Code Space
+#
+
+def permute_index( index, size, key ):
+    '''
+        Map index to unique shuffled position in range 0 to size - 1
+        use Feistel network with cycle walking so every index get different position
+        Input: index (int), size of range (int), key (str)
+        Output: position (int)
+        for example: permute_index( 0, 9000, 'userCode' ) => 1469
+    '''
+
+    # number of bits for each half of Feistel network
+    halfBits = max( 1, ( ( size - 1 ).bit_length() + 1 ) // 2 )
+    mask = ( 1 << halfBits ) - 1
+
+    value = index
+    while True:
+        left = value >> halfBits
+        right = value & mask
+
+        # shuffle halves by 4 rounds of keyed hash
+        for roundIndex in range( 4 ):
+            digest = hashlib.blake2b( f'{key}:{roundIndex}:{right}'.encode(), digest_size = 8 ).digest()
+            left, right = right, left ^ ( int.from_bytes( digest, 'big' ) & mask )
+
+        value = ( left << halfBits ) | right
+
+        # walk again until value is in range
+        if value < size:
+            return value
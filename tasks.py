@@ -0,0 +1,547 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import json
+import time
+import fcntl
+import heapq
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+##############################################################
+#
+#   Config
+#
+
+# seconds between reload of upcoming guest expiry from database
+# NOTE: pick up guest that accepted by other worker
+GUEST_EXPIRY_RESYNC = int( os.getenv( 'GUEST_EXPIRY_RESYNC', 300 ) )
+
+# seconds between scan of lock that is marked as tombstone
+LOCK_REAP_INTERVAL = int( os.getenv( 'LOCK_REAP_INTERVAL', 60 ) )
+
+# number of lock that is deleted per batch
+LOCK_REAP_BATCH = int( os.getenv( 'LOCK_REAP_BATCH', 100 ) )
+
+# directory of journal of write-behind queue
+# NOTE: mount volume here so event that is not written to database survive restart of container
+WRITE_BEHIND_DIR = os.getenv( 'WRITE_BEHIND_DIR', 'journal' )
+
+# maximum number of event that is written to database per batch
+WRITE_BEHIND_BATCH = int( os.getenv( 'WRITE_BEHIND_BATCH', 500 ) )
+
+# seconds that flusher wait to collect more event into batch
+WRITE_BEHIND_INTERVAL = float( os.getenv( 'WRITE_BEHIND_INTERVAL', 0.2 ) )
+
+# bytes of journal segment before new segment is started
+WRITE_BEHIND_SEGMENT_BYTES = int( os.getenv( 'WRITE_BEHIND_SEGMENT_BYTES', 4 * 1024 * 1024 ) )
+
+# fsync journal before request return, false keep event only in page cache of os
+WRITE_BEHIND_FSYNC = os.getenv( 'WRITE_BEHIND_FSYNC', 'true' ).lower() == 'true'
+
+##############################################################
+#
+#   Guest Expiry Scheduler
+#
+
+class GuestExpiryScheduler:
+    '''
+        Expire guest at expire datetime in background thread
+        keep min-heap of ( expireDatetime, lockId, userId ) and sleep until the earliest one
+        load callback: load( until ) => list of ( expireDatetime, lockId, userId ) that expire before until
+        expire callback: expire() expire every guest that is due
+    '''
+
+    def __init__( self, load, expire, resync = GUEST_EXPIRY_RESYNC ):
+        '''
+            Input: load callback, expire callback, seconds between reload (int)
+        '''
+
+        self.load = load
+        self.expire = expire
+        self.resync = resync
+
+        # min-heap of ( expireDatetime, lockId, userId )
+        self.heap = list()
+
+        # ( lockId, userId, expireDatetime ) that already in heap
+        self.scheduled = set()
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.nextResync = datetime.now()
+
+    def schedule( self, expireDatetime, lockId, userId ):
+        '''
+            Add guest to heap and wake up thread if it is the earliest one
+            Input: expire datetime (datetime), lockId (str), userId (str)
+        '''
+
+        with self.condition:
+            if ( lockId, userId, expireDatetime ) in self.scheduled:
+                return
+
+            self.scheduled.add( ( lockId, userId, expireDatetime ) )
+            heapq.heappush( self.heap, ( expireDatetime, lockId, userId ) )
+            self.condition.notify()
+
+    def start( self ):
+        '''
+            Start background thread
+            NOTE: first loop run catch-up sweep of every guest that already expired
+        '''
+
+        self.running = True
+        self.thread = threading.Thread( target = self.run, name = 'guest-expiry', daemon = True )
+        self.thread.start()
+
+    def stop( self ):
+        '''
+            Stop background thread
+        '''
+
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+        if self.thread:
+            self.thread.join( timeout = 5 )
+
+    def reload( self ):
+        '''
+            Load guest that expire before next reload from database
+        '''
+
+        self.nextResync = datetime.now() + timedelta( seconds = self.resync )
+        for expireDatetime, lockId, userId in self.load( self.nextResync ):
+            self.schedule( expireDatetime, lockId, userId )
+
+    def run( self ):
+        '''
+            Loop of background thread
+        '''
+
+        while self.running:
+
+            # reload upcoming guest
+            if datetime.now() >= self.nextResync:
+                try:
+                    self.reload()
+                except Exception as e:
+                    print( e )
+
+            isDue = False
+            with self.condition:
+                now = datetime.now()
+
+                # pop every guest that is due
+                while self.heap and self.heap[0][0] <= now:
+                    expireDatetime, lockId, userId = heapq.heappop( self.heap )
+                    self.scheduled.discard( ( lockId, userId, expireDatetime ) )
+                    isDue = True
+
+                # sleep until the earliest guest or next reload
+                if not isDue:
+                    wakeup = self.nextResync
+                    if self.heap and self.heap[0][0] < wakeup:
+                        wakeup = self.heap[0][0]
+                    self.condition.wait( timeout = max( ( wakeup - now ).total_seconds(), 0 ) )
+                    continue
+
+            # NOTE: expire callback sweep every guest that is due in one batch
+            try:
+                self.expire()
+            except Exception as e:
+                print( e )
+
+##############################################################
+#
+#   Lock Reaper
+#
+
+class LockReaper:
+    '''
+        Delete lock that is marked as tombstone in background thread
+        reap callback: reap() => number of lock that is deleted in one batch
+        run next batch at once when batch is full, otherwise sleep until wake up or next interval
+    '''
+
+    def __init__( self, reap, interval = LOCK_REAP_INTERVAL, batchSize = LOCK_REAP_BATCH ):
+        '''
+            Input: reap callback, seconds between scan (int), batch size (int)
+        '''
+
+        self.reap = reap
+        self.interval = interval
+        self.batchSize = batchSize
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.isWaked = False
+
+    def wake( self ):
+        '''
+            Wake up thread when new lock is marked as tombstone
+        '''
+
+        with self.condition:
+            self.isWaked = True
+            self.condition.notify()
+
+    def start( self ):
+        '''
+            Start background thread
+        '''
+
+        self.running = True
+        self.thread = threading.Thread( target = self.run, name = 'lock-reaper', daemon = True )
+        self.thread.start()
+
+    def stop( self ):
+        '''
+            Stop background thread
+        '''
+
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+        if self.thread:
+            self.thread.join( timeout = 5 )
+
+    def run( self ):
+        '''
+            Loop of background thread
+        '''
+
+        while self.running:
+            amount = 0
+            try:
+                amount = self.reap()
+            except Exception as e:
+                print( e )
+
+            # run next batch at once when batch is full
+            if amount >= self.batchSize:
+                continue
+
+            with self.condition:
+                if not self.isWaked and self.running:
+                    self.condition.wait( timeout = self.interval )
+                self.isWaked = False
+
+##############################################################
+#
+#   Write-Behind Queue
+#
+
+class WriteBehindQueue:
+    '''
+        Queue of event that is written to database in background thread after response is returned
+        event is appended to journal file before it is accepted so it is not lost when worker stop
+        flush callback: flush( list of event ) write batch of event, it must be idempotent by eventId
+        because event is delivered at least once, e.g. worker stop after flush but before journal is deleted
+        journal is directory of segment file, one json event per line:
+            journal/slot-0/000001.log
+            journal/slot-0/000002.log
+        every worker lock one slot, worker that start later replay event of slot that is left by stopped worker
+        for example:
+            queue = WriteBehindQueue( 'unlock', flush_unlock_events )
+            queue.start()
+            queue.put( { 'eventId': '5f1c0e1e2b7a4c7e9a3d2c1b0a9f8e7d', 'lockId': '12345', 'userId': 'js7694' } )
+    '''
+
+    def __init__( self, name, flush, directory = WRITE_BEHIND_DIR, batchSize = WRITE_BEHIND_BATCH, interval = WRITE_BEHIND_INTERVAL, segmentBytes = WRITE_BEHIND_SEGMENT_BYTES, fsync = WRITE_BEHIND_FSYNC ):
+        '''
+            Input: name of queue (str), flush callback, journal directory (str), batch size (int),
+                   seconds to collect batch (float), bytes of segment (int), fsync journal (bool)
+        '''
+
+        self.name = name
+        self.flush = flush
+        self.directory = os.path.join( directory, name )
+        self.batchSize = batchSize
+        self.interval = interval
+        self.segmentBytes = segmentBytes
+        self.fsync = fsync
+
+        # deque of ( segment number, event ) that is not written to database yet
+        self.pending = deque()
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+        # queue reject new event after stop
+        self.closed = False
+
+        # journal of this worker
+        self.slotDirectory = None
+        self.slotLock = None
+        self.segment = 0
+        self.file = None
+
+        self.flushed = 0
+        self.failures = 0
+        self.lastError = None
+
+    def open( self ):
+        '''
+            Lock free slot of journal and load event that is left in it
+        '''
+
+        os.makedirs( self.directory, exist_ok = True )
+
+        # lock first slot that is not locked by other worker
+        slot = 0
+        while True:
+            slotDirectory = os.path.join( self.directory, 'slot-%d' % slot )
+            os.makedirs( slotDirectory, exist_ok = True )
+            slotLock = open( os.path.join( slotDirectory, 'lock' ), 'w' )
+            try:
+                fcntl.flock( slotLock, fcntl.LOCK_EX | fcntl.LOCK_NB )
+                break
+            except BlockingIOError:
+                slotLock.close()
+                slot += 1
+
+        self.slotDirectory = slotDirectory
+        self.slotLock = slotLock
+
+        # replay event of every segment that is left
+        for segment in self.segments():
+            for event in self.read_segment( self.segment_path( segment ) ):
+                self.pending.append( ( segment, event ) )
+            self.segment = segment
+
+        self.rotate()
+
+        # take over event of slot that is not locked by any worker
+        # NOTE: slot of worker that is gone when number of worker is decreased is never locked again
+        for fileName in sorted( os.listdir( self.directory ) ):
+            orphanDirectory = os.path.join( self.directory, fileName )
+            if not fileName.startswith( 'slot-' ) or orphanDirectory == self.slotDirectory or not os.path.isdir( orphanDirectory ):
+                continue
+            self.adopt( orphanDirectory )
+
+    @staticmethod
+    def read_segment( path ):
+        '''
+            Read every event of segment
+            NOTE: line that is written partly when worker stop is skipped
+            Input: path of segment (str)
+            Output: list of event (list)
+        '''
+
+        events = list()
+        with open( path, 'rb' ) as file:
+            for line in file:
+                try:
+                    events.append( json.loads( line ) )
+                except ValueError:
+                    continue
+
+        return events
+
+    def adopt( self, orphanDirectory ):
+        '''
+            Move event of slot that is not locked to journal of this worker
+            event is written to own segment before orphan segment is deleted so it is never lost
+            NOTE: event can be replayed twice when worker stop in the middle, flush is idempotent by eventId
+            Input: path of slot directory (str)
+        '''
+
+        orphanLock = open( os.path.join( orphanDirectory, 'lock' ), 'w' )
+        try:
+            fcntl.flock( orphanLock, fcntl.LOCK_EX | fcntl.LOCK_NB )
+        except BlockingIOError:
+            orphanLock.close()
+            return
+
+        try:
+            paths = sorted( os.path.join( orphanDirectory, fileName ) for fileName in os.listdir( orphanDirectory ) if fileName.endswith( '.log' ) )
+            for path in paths:
+                for event in self.read_segment( path ):
+                    self.file.write( ( json.dumps( event, separators = ( ',', ':' ) ) + '\n' ).encode() )
+                    self.pending.append( ( self.segment, event ) )
+
+            self.file.flush()
+            os.fsync( self.file.fileno() )
+
+            for path in paths:
+                os.remove( path )
+        finally:
+            orphanLock.close()
+
+    def segments( self ):
+        '''
+            Get number of every segment in slot order by number
+            Output: list of segment number (list)
+        '''
+
+        return sorted( int( fileName[:-4] ) for fileName in os.listdir( self.slotDirectory ) if fileName.endswith( '.log' ) )
+
+    def segment_path( self, segment ):
+        '''
+            Get path of segment
+            Input: segment number (int)
+            Output: path (str)
+        '''
+
+        return os.path.join( self.slotDirectory, '%06d.log' % segment )
+
+    def rotate( self ):
+        '''
+            Start new segment
+            NOTE: caller must hold condition except in open
+        '''
+
+        if self.file:
+            self.file.close()
+
+        self.segment += 1
+        self.file = open( self.segment_path( self.segment ), 'ab' )
+
+    def put( self, event ):
+        '''
+            Append event to journal and queue
+            Input: event (dict) that can be dumped to json with eventId (str)
+            NOTE: raise RuntimeError when queue is stopped
+        '''
+
+        line = ( json.dumps( event, separators = ( ',', ':' ) ) + '\n' ).encode()
+
+        with self.condition:
+            if self.closed:
+                raise RuntimeError( 'Write-behind queue %s is stopped' % self.name )
+
+            if self.file.tell() + len( line ) > self.segmentBytes and self.file.tell() > 0:
+                self.rotate()
+
+            self.file.write( line )
+            self.file.flush()
+            if self.fsync:
+                os.fsync( self.file.fileno() )
+
+            self.pending.append( ( self.segment, event ) )
+
+            # wake up flusher when batch is full
+            if len( self.pending ) >= self.batchSize:
+                self.condition.notify()
+
+    def compact( self ):
+        '''
+            Delete segment that every event is written to database
+            NOTE: caller must hold condition
+        '''
+
+        if self.pending:
+            oldest = self.pending[0][0]
+        else:
+            # start new segment so current one can be deleted
+            if self.file.tell() > 0:
+                self.rotate()
+            oldest = self.segment
+
+        for segment in self.segments():
+            if segment < oldest:
+                os.remove( self.segment_path( segment ) )
+
+    def start( self ):
+        '''
+            Open journal and start background thread
+            NOTE: event that is left in journal is written first
+        '''
+
+        self.open()
+
+        self.closed = False
+        self.running = True
+        self.thread = threading.Thread( target = self.run, name = 'write-behind-' + self.name, daemon = True )
+        self.thread.start()
+
+    def stop( self ):
+        '''
+            Stop background thread after every pending event is written
+            NOTE: event that is not written in time is kept in journal
+            NOTE: journal and slot are kept open while thread is still running, they are released at exit of process
+        '''
+
+        with self.condition:
+            self.closed = True
+            self.running = False
+            self.condition.notify()
+
+        if self.thread:
+            self.thread.join( timeout = 10 )
+            if self.thread.is_alive():
+                print( 'Write-behind queue %s is still writing at stop' % self.name )
+                return
+
+        with self.condition:
+            if self.file:
+                self.file.close()
+                self.file = None
+            if self.slotLock:
+                self.slotLock.close()
+                self.slotLock = None
+
+    def run( self ):
+        '''
+            Loop of background thread
+            write batch of event and retry with backoff when it is failed
+        '''
+
+        backoff = 0
+
+        while True:
+            with self.condition:
+                # wait for batch to be full or interval
+                if self.running and len( self.pending ) < self.batchSize:
+                    self.condition.wait( timeout = self.interval )
+
+                if not self.pending:
+                    if not self.running:
+                        return
+                    continue
+
+                batch = [ event for segment, event in list( self.pending )[:self.batchSize] ]
+
+            try:
+                self.flush( batch )
+            except Exception as e:
+                print( e )
+                self.failures += 1
+                self.lastError = str( e )
+
+                # NOTE: give up at stop, event is replayed from journal at next start
+                if not self.running:
+                    return
+
+                backoff = min( max( backoff * 2, 0.5 ), 30 )
+                time.sleep( backoff )
+                continue
+
+            backoff = 0
+
+            with self.condition:
+                for _ in batch:
+                    self.pending.popleft()
+                self.flushed += len( batch )
+                self.compact()
+
+    def stats( self ):
+        '''
+            Get counter of queue
+            Output: dict of counter
+            for example: { 'pending': 3, 'flushed': 15230, 'failures': 0, 'lastError': None }
+        '''
+
+        with self.condition:
+            return { 'pending': len( self.pending ), 'flushed': self.flushed, 'failures': self.failures, 'lastError': self.lastError }
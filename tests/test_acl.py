@@ -0,0 +1,48 @@
+import pytest
+import asyncio
+
+pytest.importorskip( 'pymongo' )
+
+from acl import LockAclCache
+
+class FakeCollection:
+    '''
+        Collection that return projected document like MongoDB
+    '''
+
+    def __init__( self, documents ):
+        self.documents = documents
+
+    async def find_one( self, query, projection = None ):
+        for document in self.documents:
+            if all( document.get( field ) == value for field, value in query.items() ):
+                if projection is None:
+                    return dict( document )
+                fields = { field for field, include in projection.items() if include }
+                return { field: value for field, value in document.items() if field in fields or ( field == '_id' and projection.get( '_id', 1 ) ) }
+        return None
+
+class FakeMemberships:
+    def __init__( self, memberships ):
+        self.memberships = memberships
+
+    async def roster( self, lockId, roles = None ):
+        return [ membership for membership in self.memberships if membership['lockId'] == lockId ]
+
+def make_acl( locks, memberships ):
+    return LockAclCache( { 'Locks': FakeCollection( locks ) }, FakeMemberships( memberships ) )
+
+def test_admin_of_live_lock_has_admin_role():
+    acl = make_acl( [ { '_id': 1, 'lockId': 'lock01' } ], [ { 'userId': 'js7694', 'lockId': 'lock01', 'role': 'admin' } ] )
+
+    assert asyncio.run( acl.role( 'js7694', 'lock01' ) ) == 'admin'
+
+def test_tombstone_lock_has_no_role():
+    acl = make_acl( [ { '_id': 1, 'lockId': 'lock01', 'deleted': True } ], [ { 'userId': 'js7694', 'lockId': 'lock01', 'role': 'admin' } ] )
+
+    assert asyncio.run( acl.role( 'js7694', 'lock01' ) ) is None
+
+def test_missing_lock_has_no_role():
+    acl = make_acl( [], [] )
+
+    assert asyncio.run( acl.role( 'js7694', 'lock01' ) ) is None
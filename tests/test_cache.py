@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip( 'pymongo' )
+pytest.importorskip( 'starlette' )
+
+import cache
+from cache import LRUCache, MISSING
+
+class FakeClock:
+    '''
+        Monotonic clock of cache that is moved by test
+    '''
+
+    def __init__( self ):
+        self.now = 1000.0
+
+    def __call__( self ):
+        return self.now
+
+@pytest.fixture
+def clock( monkeypatch ):
+    clock = FakeClock()
+    monkeypatch.setattr( cache.time, 'monotonic', clock )
+    return clock
+
+def test_key_expire_after_ttl( clock ):
+    lru = LRUCache( maxSize = 10, ttl = 60 )
+    lru.set( 'js7694', { 'firstName': 'Josephine' } )
+
+    clock.now += 59
+    assert lru.get( 'js7694' ) == { 'firstName': 'Josephine' }
+
+    clock.now += 1
+    assert lru.get( 'js7694' ) is MISSING
+    assert lru.size() == 0
+    assert lru.stats()['expirations'] == 1
+
+def test_least_recently_used_key_is_evicted( clock ):
+    lru = LRUCache( maxSize = 2, ttl = 60 )
+    lru.set( 'js7694', 'Josephine' )
+    lru.set( 'tw8769', 'Taylor' )
+
+    # read first key so second key is least recently used
+    assert lru.get( 'js7694' ) == 'Josephine'
+    lru.set( 'sd1234', 'Sophia' )
+
+    assert lru.get_many( [ 'js7694', 'tw8769', 'sd1234' ] ) == { 'js7694': 'Josephine', 'sd1234': 'Sophia' }
+    assert lru.stats()['evictions'] == 1
+
+def test_set_again_refresh_ttl( clock ):
+    lru = LRUCache( maxSize = 10, ttl = 60 )
+    lru.set( 'js7694', 'Josephine' )
+
+    clock.now += 50
+    lru.set( 'js7694', 'Jo' )
+    clock.now += 50
+
+    assert lru.get( 'js7694' ) == 'Jo'
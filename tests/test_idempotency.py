@@ -0,0 +1,130 @@
+import pytest
+import asyncio
+
+pytest.importorskip( 'pymongo' )
+
+from pymongo.errors import DuplicateKeyError
+from idempotency import IdempotencyStore, IdempotencyMiddleware
+
+class FakeKeyCollection:
+    '''
+        Key collection that support only query by _id, status, fingerprint and datetime like IdempotencyStore use
+    '''
+
+    def __init__( self ):
+        self.documents = dict()
+
+    def matches( self, document, query ):
+        for field, value in query.items():
+            if isinstance( value, dict ):
+                if not document[field] < value['$lt']:
+                    return False
+            elif document.get( field ) != value:
+                return False
+        return True
+
+    async def insert_one( self, document ):
+        if document['_id'] in self.documents:
+            raise DuplicateKeyError( 'duplicate key' )
+        self.documents[document['_id']] = dict( document )
+
+    async def find_one( self, query ):
+        document = self.documents.get( query['_id'] )
+        return dict( document ) if document and self.matches( document, query ) else None
+
+    async def find_one_and_update( self, query, update ):
+        document = await self.find_one( query )
+        if document:
+            self.documents[query['_id']].update( update['$set'] )
+        return document
+
+    async def update_one( self, query, update ):
+        if await self.find_one( query ):
+            self.documents[query['_id']].update( update['$set'] )
+
+    async def delete_one( self, query ):
+        if await self.find_one( query ):
+            del self.documents[query['_id']]
+
+class FakeApp:
+    '''
+        ASGI app that count call and answer with status and body
+    '''
+
+    def __init__( self, status = 200 ):
+        self.status = status
+        self.calls = 0
+
+    async def __call__( self, scope, receive, send ):
+        self.calls += 1
+        request = await receive()
+        body = b'{"echo": "%s", "call": %d}' % ( request['body'], self.calls )
+        await send( { 'type': 'http.response.start', 'status': self.status, 'headers': [ ( b'content-type', b'application/json' ) ] } )
+        await send( { 'type': 'http.response.body', 'body': body } )
+
+def make_middleware( status = 200 ):
+    app = FakeApp( status )
+    store = IdempotencyStore( { 'IdempotencyKeys': FakeKeyCollection() } )
+    return IdempotencyMiddleware( app, store ), app, store
+
+def send_request( middleware, body, key = b'6f1c2e0a' ):
+    '''
+        Send POST /request through middleware
+        Output: ( status code (int), headers (dict), body (bytes) )
+    '''
+
+    scope = { 'type': 'http', 'method': 'POST', 'path': '/request', 'query_string': b'', 'headers': [ ( b'idempotency-key', key ) ] }
+    messages = list()
+
+    async def receive():
+        return { 'type': 'http.request', 'body': body, 'more_body': False }
+
+    async def send( message ):
+        messages.append( message )
+
+    asyncio.run( middleware( scope, receive, send ) )
+
+    return messages[0]['status'], dict( messages[0]['headers'] ), b''.join( message.get( 'body', b'' ) for message in messages[1:] )
+
+def test_retry_is_replayed_without_running_handler():
+    middleware, app, store = make_middleware()
+
+    first = send_request( middleware, b'lock01' )
+    retry = send_request( middleware, b'lock01' )
+
+    assert app.calls == 1
+    assert retry[0] == first[0] == 200
+    assert retry[2] == first[2]
+    assert retry[1][b'idempotent-replayed'] == b'true'
+
+def test_key_of_other_request_is_rejected():
+    middleware, app, store = make_middleware()
+
+    send_request( middleware, b'lock01' )
+    status, headers, body = send_request( middleware, b'lock02' )
+
+    assert status == 422
+    assert app.calls == 1
+
+def test_key_in_progress_is_conflict():
+    middleware, app, store = make_middleware()
+
+    # first request is still handled by other worker
+    fingerprint = store.fingerprint( 'POST', '/request', b'', b'lock01' )
+    asyncio.run( store.begin( '6f1c2e0a', fingerprint ) )
+
+    status, headers, body = send_request( middleware, b'lock01' )
+
+    assert status == 409
+    assert app.calls == 0
+
+def test_server_error_release_key_so_retry_run_again():
+    middleware, app, store = make_middleware( status = 503 )
+
+    assert send_request( middleware, b'lock01' )[0] == 503
+    assert store.db['IdempotencyKeys'].documents == {}
+
+    app.status = 200
+    assert send_request( middleware, b'lock01' )[0] == 200
+    assert app.calls == 2
+    assert store.db['IdempotencyKeys'].documents['6f1c2e0a']['status'] == 'done'
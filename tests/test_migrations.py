@@ -0,0 +1,136 @@
+import pytest
+
+mongomock = pytest.importorskip( 'mongomock' )
+
+from datetime import datetime, timedelta
+from migrations import run_migration, MIGRATION_COLLECTION
+from migrations.m0002_lock_event_buckets import LockEventBuckets
+from migrations.m0003_memberships import UserMemberships
+
+class Interrupted( Exception ):
+    pass
+
+def quiet( message ):
+    pass
+
+def make_locks( db, eventsPerLock = 3, lockIds = ( 'lock01', 'lock02', 'lock03' ) ):
+    '''
+        Add lock that is not migrated with its history, connect and warning
+    '''
+
+    start = datetime( 2024, 10, 25, 8 )
+    for lockId in lockIds:
+        histories, connects = list(), list()
+        for index in range( eventsPerLock ):
+            dateTime = start + timedelta( hours = index * 9 )
+            db['History'].insert_one( { 'hisId': f'his-{lockId}-{index}', 'userId': 'js7694', 'lockId': lockId, 'status': 'connect', 'datetime': dateTime } )
+            db['Connect'].insert_one( { 'conId': f'con-{lockId}-{index}', 'userId': 'js7694', 'lockId': lockId, 'datetime': dateTime } )
+            histories.append( f'his-{lockId}-{index}' )
+            connects.append( f'con-{lockId}-{index}' )
+
+        # NOTE: first warning is already ignored so it is not in warning list of lock
+        db['Warning'].insert_one( { 'warningId': f'warn-{lockId}-0', 'userId': 'js7694', 'lockId': lockId, 'message': 'Authentication failed', 'datetime': start } )
+        db['Warning'].insert_one( { 'warningId': f'warn-{lockId}-1', 'userId': 'js7694', 'lockId': lockId, 'message': 'Authentication failed', 'datetime': start + timedelta( days = 1 ) } )
+
+        db['Locks'].insert_one( { 'lockId': lockId, 'history': histories, 'connect': connects, 'warning': [ f'warn-{lockId}-1' ] } )
+
+def bucket_events( db ):
+    return sorted( event['id'] for bucket in db['LockEvents'].find() for event in bucket['events'] )
+
+def test_lock_event_buckets_run_twice():
+    db = mongomock.MongoClient().db
+    make_locks( db )
+
+    report = run_migration( db, LockEventBuckets(), sleep = 0, log = quiet )
+    events = bucket_events( db )
+
+    assert report['documents'] == 3
+    assert len( events ) == 3 * ( 3 + 3 + 2 )
+    for lock in db['Locks'].find():
+        assert lock['schemaVersion'] == 2
+        assert lock['warningCount'] == 1
+        assert lock['lastWarningDatetime'] == datetime( 2024, 10, 26, 8 )
+        assert 'history' not in lock and 'connect' not in lock and 'warning' not in lock
+
+    # NOTE: migration that is done is skipped, and without checkpoint every lock is already at version
+    assert run_migration( db, LockEventBuckets(), sleep = 0, log = quiet )['documents'] == 0
+    db[MIGRATION_COLLECTION].delete_many( {} )
+    assert run_migration( db, LockEventBuckets(), sleep = 0, log = quiet )['documents'] == 0
+    assert bucket_events( db ) == events
+
+def test_lock_event_buckets_resume_after_interrupt():
+    db = mongomock.MongoClient().db
+    make_locks( db )
+
+    def interrupt( message ):
+        raise Interrupted( message )
+
+    # stop after checkpoint of first batch
+    with pytest.raises( Interrupted ):
+        run_migration( db, LockEventBuckets(), batchSize = 3, sleep = 0, log = interrupt )
+
+    checkpoint = db[MIGRATION_COLLECTION].find_one( { '_id': 'Locks:2' } )
+    assert checkpoint['processed'] == 1
+    assert not checkpoint.get( 'done' )
+
+    # stop after bucket of second batch is written but before lock is marked
+    migration = LockEventBuckets()
+    migrate = migration.migrate
+
+    def migrate_bucket_only( db, documents ):
+        operations = migrate( db, documents )
+        db['LockEvents'].bulk_write( operations['LockEvents'] )
+        raise Interrupted( 'stopped before lock is marked' )
+
+    migration.migrate = migrate_bucket_only
+    with pytest.raises( Interrupted ):
+        run_migration( db, migration, batchSize = 3, sleep = 0, log = quiet )
+
+    report = run_migration( db, LockEventBuckets(), batchSize = 3, sleep = 0, log = quiet )
+
+    assert report['documents'] == 2
+    assert db[MIGRATION_COLLECTION].find_one( { '_id': 'Locks:2' } )['done']
+    assert db['Locks'].count_documents( { 'schemaVersion': 2 } ) == 3
+    assert len( bucket_events( db ) ) == len( set( bucket_events( db ) ) ) == 3 * ( 3 + 3 + 2 )
+
+def test_lock_event_buckets_dry_run_writes_nothing():
+    db = mongomock.MongoClient().db
+    make_locks( db )
+
+    report = run_migration( db, LockEventBuckets(), dryRun = True, sleep = 0, log = quiet )
+
+    # NOTE: one DeleteMany of bucket per batch and one update per event
+    assert report['dryRun']
+    assert report['documents'] == 3
+    assert report['operations'] == { 'LockEvents': report['batches'] + 3 * ( 3 + 3 + 2 ), 'Locks': 3 }
+    assert db['LockEvents'].count_documents( {} ) == 0
+    assert db[MIGRATION_COLLECTION].count_documents( {} ) == 0
+    assert db['Locks'].count_documents( { 'schemaVersion': 2 } ) == 0
+
+def test_lock_event_buckets_batch_by_event_count():
+    db = mongomock.MongoClient().db
+    make_locks( db, eventsPerLock = 2 )
+
+    # NOTE: size of lock is 2 history + 2 connect + 1 warning
+    report = run_migration( db, LockEventBuckets(), dryRun = True, batchSize = 10, sleep = 0, log = quiet )
+
+    assert report['batches'] == 2
+    assert report['documents'] == 3
+
+def test_user_memberships_run_twice_and_dry_run():
+    db = mongomock.MongoClient().db
+    lockDetail = { 'lockId': 'lock01', 'lockName': 'Front Door', 'lockLocation': 'Home' }
+    db['Users'].insert_one( { 'userId': 'js7694', 'admin': [ lockDetail ], 'member': [ { **lockDetail, 'lockId': 'lock02' } ], 'guest': [] } )
+    db['Locks'].insert_one( { 'lockId': 'lock01', 'admin': [ 'js7694' ] } )
+
+    dryRun = run_migration( db, UserMemberships(), dryRun = True, sleep = 0, log = quiet )
+    assert dryRun['operations'] == { 'Memberships': 2, 'Users': 1, 'Locks': 1 }
+    assert db['Memberships'].count_documents( {} ) == 0
+
+    run_migration( db, UserMemberships(), sleep = 0, log = quiet )
+    db[MIGRATION_COLLECTION].delete_many( {} )
+    run_migration( db, UserMemberships(), sleep = 0, log = quiet )
+
+    memberships = { membership['lockId']: membership['role'] for membership in db['Memberships'].find() }
+    assert memberships == { 'lock01': 'admin', 'lock02': 'member' }
+    assert 'admin' not in db['Users'].find_one() and 'admin' not in db['Locks'].find_one()
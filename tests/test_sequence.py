@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip( 'pymongo' )
+
+from sequence import permute_index
+
+@pytest.mark.parametrize( 'size', [ 1, 2, 7, 9000, 10007 ] )
+def test_permute_index_is_bijection( size ):
+    positions = [ permute_index( index, size, 'userCode' ) for index in range( size ) ]
+
+    assert sorted( positions ) == list( range( size ) )
+
+def test_permute_index_depends_on_key():
+    size = 9000
+    userCodes = [ permute_index( index, size, 'userCode' ) for index in range( 100 ) ]
+    userIds = [ permute_index( index, size, 'userId:js' ) for index in range( 100 ) ]
+
+    assert userCodes == [ permute_index( index, size, 'userCode' ) for index in range( 100 ) ]
+    assert userCodes != userIds
+    assert userCodes != list( range( 100 ) )
@@ -0,0 +1,76 @@
+import os
+import json
+
+from tasks import WriteBehindQueue
+
+class FakeDatabase:
+    '''
+        Flush callback that keep every event that is written
+    '''
+
+    def __init__( self ):
+        self.events = list()
+
+    def __call__( self, events ):
+        self.events += events
+
+def make_queue( directory, flush ):
+    return WriteBehindQueue( 'unlock', flush, directory = str( directory ), batchSize = 10, interval = 0.01, fsync = False )
+
+def make_event( index ):
+    return { 'eventId': 'con%05d' % index, 'lockId': 'lock01', 'userId': 'js7694' }
+
+def crash( queue ):
+    '''
+        Close journal and release slot without writing pending event like worker that is killed
+    '''
+
+    queue.file.close()
+    queue.slotLock.close()
+
+def journal_events( directory ):
+    events = list()
+    for root, directories, fileNames in os.walk( directory ):
+        for fileName in sorted( fileNames ):
+            if fileName.endswith( '.log' ):
+                events += WriteBehindQueue.read_segment( os.path.join( root, fileName ) )
+    return events
+
+def test_event_left_in_journal_is_replayed_at_start( tmp_path ):
+    stopped = make_queue( tmp_path, FakeDatabase() )
+    stopped.open()
+    for index in range( 3 ):
+        stopped.put( make_event( index ) )
+    crash( stopped )
+
+    database = FakeDatabase()
+    queue = make_queue( tmp_path, database )
+    queue.start()
+    queue.stop()
+
+    assert database.events == [ make_event( index ) for index in range( 3 ) ]
+    assert queue.stats()['pending'] == 0
+    assert journal_events( tmp_path ) == []
+
+def test_orphan_slot_is_adopted_and_locked_slot_is_not( tmp_path ):
+    # slot of worker that is still running
+    running = make_queue( tmp_path, FakeDatabase() )
+    running.open()
+    running.put( make_event( 10 ) )
+
+    # slot of worker that is gone, last line is written partly
+    orphanDirectory = tmp_path / 'unlock' / 'slot-3'
+    orphanDirectory.mkdir( parents = True )
+    lines = [ json.dumps( make_event( index ) ) for index in range( 2 ) ]
+    ( orphanDirectory / '000001.log' ).write_text( '\n'.join( lines ) + '\n{"eventId": "con0' )
+
+    database = FakeDatabase()
+    queue = make_queue( tmp_path, database )
+    queue.start()
+    queue.stop()
+
+    assert database.events == [ make_event( 0 ), make_event( 1 ) ]
+    assert not any( fileName.endswith( '.log' ) for fileName in os.listdir( orphanDirectory ) )
+    assert journal_events( running.slotDirectory ) == [ make_event( 10 ) ]
+
+    crash( running )
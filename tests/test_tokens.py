@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip( 'jwt' )
+
+import tokens
+from tokens import TokenGuard
+
+class FakeClock:
+    '''
+        Clock of token guard that is moved by test
+    '''
+
+    def __init__( self, now ):
+        self.now = now
+
+    def __call__( self, dateTime = None ):
+        return self.now
+
+@pytest.fixture
+def clock( monkeypatch ):
+    clock = FakeClock( 1729879200 )
+    monkeypatch.setattr( tokens, 'token_time', clock )
+    return clock
+
+def make_payload( jti, iat, ttl = 1800, userId = 'js7694', lockId = 'lock01' ):
+    return { 'jti': jti, 'userId': userId, 'lockId': lockId, 'iat': iat, 'exp': iat + ttl }
+
+def test_token_is_used_once( clock ):
+    guard = TokenGuard( ttl = 1800, bucketSeconds = 60 )
+    payload = make_payload( 'token01', clock.now )
+
+    assert guard.use( payload ) == 'ok'
+    assert guard.use( payload ) == 'used'
+    assert guard.use( make_payload( 'token02', clock.now ) ) == 'ok'
+    assert guard.stats()['rejected'] == 1
+
+def test_token_issued_in_second_of_revocation_is_revoked( clock ):
+    guard = TokenGuard( ttl = 1800, bucketSeconds = 60 )
+    guard.revoke( 'js7694', 'lock01' )
+
+    # NOTE: iat is in seconds, token that is issued in the same second may be issued before revocation
+    assert guard.use( make_payload( 'token01', clock.now ) ) == 'revoked'
+    assert guard.use( make_payload( 'token02', clock.now + 1 ) ) == 'ok'
+    assert guard.use( make_payload( 'token03', clock.now, userId = 'tw8769' ) ) == 'ok'
+
+def test_compact_drops_expired_bucket_and_revocation( clock ):
+    guard = TokenGuard( ttl = 120, bucketSeconds = 60 )
+    guard.revoke( 'js7694', 'lock01' )
+    for index in range( 3 ):
+        guard.use( make_payload( 'token%02d' % index, clock.now + 1, ttl = 120 ) )
+
+    assert guard.stats()['tokens'] == 3
+
+    # every token of first bucket is expired, next use compact it
+    clock.now += 3 * 60
+    assert guard.use( make_payload( 'token10', clock.now, ttl = 120 ) ) == 'ok'
+
+    assert guard.stats() == { 'buckets': 1, 'tokens': 1, 'revoked': 0, 'used': 4, 'rejected': 0 }
@@ -0,0 +1,405 @@
+##############################################################
+#
+#   import section
+#
+
+import os
+import sys
+import json
+import uuid
+import argparse
+import threading
+from datetime import datetime, timezone
+import jwt
+from jwt.algorithms import get_default_algorithms
+
+##############################################################
+#
+#   Config
+#
+
+# directory of signing key of unlock token, one pem file per key id
+# NOTE: <kid>.pem is private key that can sign, <kid>.pub.pem is public key of retired key that only verify
+TOKEN_KEY_DIR = os.getenv( 'TOKEN_KEY_DIR', 'keys' )
+
+# key id that sign new token, default is the latest private key by name
+TOKEN_ACTIVE_KID = os.getenv( 'TOKEN_ACTIVE_KID' )
+
+# algorithm of every key file by key type
+KEY_ALGORITHMS = { 'EC': 'ES256', 'OKP': 'EdDSA' }
+
+# seconds that unlock token is valid
+TOKEN_TTL = int( os.getenv( 'TOKEN_TTL', 30 * 60 ) )
+
+# seconds of one bucket of used token, token of bucket is dropped together when bucket is expired
+TOKEN_BUCKET_SECONDS = int( os.getenv( 'TOKEN_BUCKET_SECONDS', 60 ) )
+
+##############################################################
+#
+#   Token Signer
+#
+
+class TokenSigner:
+    '''
+        Sign and verify unlock token
+        with key in key directory token is signed by ES256 or EdDSA and has kid in header
+        so lock can verify it offline by public key from keyset, without key token is signed by HS256 with secret
+        for example:
+            signer = TokenSigner( secret )
+            token = signer.sign( { 'userId': 'js7694', 'lockId': '12345', 'exp': token_time( datetime( 2024, 10, 25, 18, 30 ) ) } )
+            signer.verify( token ) => { 'userId': 'js7694', 'lockId': '12345', 'exp': 1729881000, ... }
+            signer.keyset() => { 'keys': [ { 'kty': 'EC', 'crv': 'P-256', 'kid': '20241025-1a2b', 'alg': 'ES256', 'use': 'sig', ... } ] }
+        NOTE: HS256 token without kid is still verified by secret so token that is issued before rotation keep working
+    '''
+
+    def __init__( self, secret, keyDir = TOKEN_KEY_DIR, activeKid = TOKEN_ACTIVE_KID ):
+        '''
+            Input: secret of HS256 (str), key directory (str), key id that sign new token (str)(optional)
+        '''
+
+        self.secret = secret
+        self.keyDir = keyDir
+        self.activeKid = activeKid
+
+        # kid -> { 'algorithm': 'ES256', 'private': private key or None, 'public': public key }
+        # NOTE: pem is parsed once, verify use parsed public key
+        self.keys = dict()
+        self.lock = threading.Lock()
+
+        self.load()
+
+    def load( self ):
+        '''
+            Load every key from key directory
+            NOTE: call again to pick up rotated key without restart
+        '''
+
+        keys = dict()
+        if os.path.isdir( self.keyDir ):
+            for fileName in sorted( os.listdir( self.keyDir ) ):
+                if not fileName.endswith( '.pem' ):
+                    continue
+
+                with open( os.path.join( self.keyDir, fileName ), 'rb' ) as file:
+                    pem = file.read()
+
+                if fileName.endswith( '.pub.pem' ):
+                    kid = fileName[:-len( '.pub.pem' )]
+                    private, public = None, load_public_key( pem )
+                else:
+                    kid = fileName[:-len( '.pem' )]
+                    private = load_private_key( pem )
+                    public = private.public_key()
+
+                keys[kid] = { 'algorithm': key_algorithm( public ), 'private': private, 'public': public }
+
+        activeKid = self.activeKid
+        if not activeKid:
+            signingKids = [ kid for kid, key in keys.items() if key['private'] ]
+            activeKid = signingKids[-1] if signingKids else None
+
+        if activeKid and ( activeKid not in keys or not keys[activeKid]['private'] ):
+            raise ValueError( 'Private key of active kid %s is not found in %s' % ( activeKid, self.keyDir ) )
+
+        with self.lock:
+            self.keys = keys
+            self.signingKid = activeKid
+
+    def sign( self, payload ):
+        '''
+            Sign payload by active key or HS256 secret
+            Input: payload (dict)
+            Output: token (str)
+        '''
+
+        with self.lock:
+            kid = self.signingKid
+            key = self.keys.get( kid )
+
+        if not key:
+            return jwt.encode( payload, self.secret, algorithm = 'HS256' )
+
+        return jwt.encode( payload, key['private'], algorithm = key['algorithm'], headers = { 'kid': kid } )
+
+    def verify( self, token, **options ):
+        '''
+            Verify token by key of kid in header or HS256 secret when there is no kid
+            Input: token (str), option of jwt.decode e.g. options = { 'verify_exp': False }
+            Output: payload (dict)
+            NOTE: raise jwt.InvalidTokenError when kid is unknown or signature is invalid
+        '''
+
+        kid = jwt.get_unverified_header( token ).get( 'kid' )
+
+        if kid is None:
+            return jwt.decode( token, self.secret, algorithms = [ 'HS256' ], **options )
+
+        key = self.keys.get( kid )
+        if not key:
+            raise jwt.InvalidTokenError( 'Unknown kid' )
+
+        return jwt.decode( token, key['public'], algorithms = [ key['algorithm'] ], **options )
+
+    def keyset( self ):
+        '''
+            Get public key of every key as JSON Web Key Set
+            Output: dict of keyset
+        '''
+
+        algorithms = get_default_algorithms()
+
+        keys = list()
+        for kid, key in self.keys.items():
+            jwk = algorithms[key['algorithm']].to_jwk( key['public'] )
+            jwk = json.loads( jwk ) if isinstance( jwk, str ) else jwk
+            keys.append( { **jwk, 'kid': kid, 'alg': key['algorithm'], 'use': 'sig' } )
+
+        return { 'keys': keys }
+
+##############################################################
+#
+#   Token Guard
+#
+
+class TokenGuard:
+    '''
+        Single-use and revocation check of unlock token in memory of worker
+        used jti is kept in bucket by exp of token, bucket is dropped when every token in it is expired
+        revocation of user in lock reject every token that is issued before it and is dropped after TOKEN_TTL
+        so memory is bounded by token that is still valid
+        for example:
+            guard = TokenGuard()
+            guard.use( { 'jti': '5f1c0e1e', 'userId': 'js7694', 'lockId': '12345', 'iat': 1729879200, 'exp': 1729881000 } ) => 'ok'
+            guard.use( { 'jti': '5f1c0e1e', ... } ) => 'used'
+            guard.revoke( 'js7694', '12345' )
+            guard.use( { 'jti': '7a3d2c1b', 'userId': 'js7694', 'lockId': '12345', 'iat': 1729879200, ... } ) => 'revoked'
+        NOTE: check is in one worker, token can be used once per worker at most
+    '''
+
+    def __init__( self, ttl = TOKEN_TTL, bucketSeconds = TOKEN_BUCKET_SECONDS ):
+        '''
+            Input: seconds that token is valid (int), seconds of one bucket (int)
+        '''
+
+        self.ttl = ttl
+        self.bucketSeconds = bucketSeconds
+
+        # bucket number -> set of jti that expire in bucket
+        self.buckets = dict()
+
+        # ( userId, lockId ) -> time of revocation
+        self.revoked = dict()
+
+        self.lock = threading.Lock()
+        self.nextCompaction = 0
+
+        self.used = 0
+        self.rejected = 0
+
+    def use( self, payload ):
+        '''
+            Mark token as used
+            Input: payload of verified token (dict) with jti, exp, iat, userId and lockId
+            Output: 'ok', 'used' if token is used before or 'revoked' if token is revoked
+        '''
+
+        now = token_time()
+
+        with self.lock:
+            if now >= self.nextCompaction:
+                self.compact( now )
+
+            # NOTE: token without iat is issued before iat is added, it is issued at most ttl before exp
+            revokedAt = self.revoked.get( ( payload['userId'], payload['lockId'] ) )
+            if revokedAt is not None and payload.get( 'iat', payload['exp'] - self.ttl ) <= revokedAt:
+                self.rejected += 1
+                return 'revoked'
+
+            bucket = self.buckets.setdefault( payload['exp'] // self.bucketSeconds, set() )
+            if payload['jti'] in bucket:
+                self.rejected += 1
+                return 'used'
+
+            bucket.add( payload['jti'] )
+            self.used += 1
+
+            return 'ok'
+
+    def revoke( self, userId, lockId ):
+        '''
+            Reject every token of user in lock that is issued until now
+            Input: userId (str), lockId (str)
+        '''
+
+        with self.lock:
+            self.revoked[( userId, lockId )] = token_time()
+
+    def revoke_many( self, keys ):
+        '''
+            Revoke token of every user in lock
+            Input: list of [ userId, lockId ] (list)
+        '''
+
+        for userId, lockId in keys:
+            self.revoke( userId, lockId )
+
+    def compact( self, now ):
+        '''
+            Drop bucket and revocation that every token of it is expired
+            NOTE: caller must hold lock, run at most once per bucket
+            Input: now (int)
+        '''
+
+        current = now // self.bucketSeconds
+        for bucket in [ bucket for bucket in self.buckets if bucket < current ]:
+            del self.buckets[bucket]
+
+        for key in [ key for key, revokedAt in self.revoked.items() if revokedAt + self.ttl < now ]:
+            del self.revoked[key]
+
+        self.nextCompaction = ( current + 1 ) * self.bucketSeconds
+
+    def stats( self ):
+        '''
+            Get counter of guard
+            Output: dict of counter
+            for example: { 'buckets': 31, 'tokens': 1820, 'revoked': 3, 'used': 15230, 'rejected': 12 }
+        '''
+
+        with self.lock:
+            return {
+                'buckets': len( self.buckets ),
+                'tokens': sum( len( bucket ) for bucket in self.buckets.values() ),
+                'revoked': len( self.revoked ),
+                'used': self.used,
+                'rejected': self.rejected,
+            }
+
+##############################################################
+#
+#   Helper Functions
+#
+
+def token_time( dateTime = None ):
+    '''
+        Get time of token claim in epoch seconds
+        iat, exp of token and time of guard are all from this so they use the same clock
+        Input: date time (datetime)(optional) default is now
+        Output: seconds (int)
+        NOTE: naive datetime is local time like datetime.now() that is stored in database,
+              PyJWT read naive datetime as UTC so claim must never be naive datetime
+    '''
+
+    return int( ( dateTime or datetime.now( timezone.utc ) ).timestamp() )
+
+def load_private_key( pem ):
+    '''
+        Load private key from pem
+        Input: pem (bytes)
+        Output: private key
+    '''
+
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+    return load_pem_private_key( pem, password = None )
+
+def load_public_key( pem ):
+    '''
+        Load public key from pem
+        Input: pem (bytes)
+        Output: public key
+    '''
+
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+    return load_pem_public_key( pem )
+
+def key_algorithm( publicKey ):
+    '''
+        Get jwt algorithm of public key
+        Input: public key
+        Output: algorithm (str) ES256 or EdDSA
+    '''
+
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    if isinstance( publicKey, ec.EllipticCurvePublicKey ) and isinstance( publicKey.curve, ec.SECP256R1 ):
+        return 'ES256'
+    if isinstance( publicKey, ed25519.Ed25519PublicKey ):
+        return 'EdDSA'
+
+    raise ValueError( 'Key must be P-256 or Ed25519' )
+
+def generate_key( keyDir, algorithm ):
+    '''
+        Generate new private key in key directory
+        Input: key directory (str), algorithm (str) ES256 or EdDSA
+        Output: key id (str)
+    '''
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    privateKey = ec.generate_private_key( ec.SECP256R1() ) if algorithm == 'ES256' else ed25519.Ed25519PrivateKey.generate()
+    pem = privateKey.private_bytes( serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption() )
+
+    # NOTE: kid start with date so the latest key is the last by name
+    kid = datetime.now().strftime( '%Y%m%d%H%M%S' ) + '-' + uuid.uuid4().hex[:4]
+
+    os.makedirs( keyDir, exist_ok = True )
+    path = os.path.join( keyDir, kid + '.pem' )
+    with open( os.open( path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600 ), 'wb' ) as file:
+        file.write( pem )
+
+    return kid
+
+def retire_key( keyDir, kid ):
+    '''
+        Replace private key by public key so key only verify token that is already issued
+        Input: key directory (str), key id (str)
+    '''
+
+    from cryptography.hazmat.primitives import serialization
+
+    path = os.path.join( keyDir, kid + '.pem' )
+    with open( path, 'rb' ) as file:
+        publicKey = load_private_key( file.read() ).public_key()
+
+    with open( os.path.join( keyDir, kid + '.pub.pem' ), 'wb' ) as file:
+        file.write( publicKey.public_bytes( serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo ) )
+
+    os.remove( path )
+
+##############################################################
+#
+#   CLI
+#
+
+def main():
+    '''
+        python tokens.py generate --algorithm ES256 => generate new key, it sign new token after restart
+        python tokens.py retire <kid>               => keep only public key of kid
+        python tokens.py jwks                       => print keyset
+        rotation: generate new key, restart, retire old key after token of old key is expired, delete .pub.pem later
+    '''
+
+    parser = argparse.ArgumentParser( description = 'Manage signing key of unlock token' )
+    parser.add_argument( 'command', choices = [ 'generate', 'retire', 'jwks' ] )
+    parser.add_argument( 'kid', nargs = '?' )
+    parser.add_argument( '--algorithm', choices = list( KEY_ALGORITHMS.values() ), default = 'ES256' )
+    parser.add_argument( '--key-dir', default = TOKEN_KEY_DIR )
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        print( generate_key( args.key_dir, args.algorithm ) )
+    elif args.command == 'retire':
+        if not args.kid:
+            parser.error( 'kid is required' )
+        retire_key( args.key_dir, args.kid )
+    else:
+        print( json.dumps( TokenSigner( None, args.key_dir ).keyset(), indent = 4 ) )
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit( main() )
@@ -0,0 +1,94 @@
+##############################################################
+#
+#   import section
+#
+
+import hashlib
+
+##############################################################
+#
+#   Version Store
+#
+
+class VersionStore:
+    '''
+        Monotonic version counter of Users and Locks document for conditional GET
+        every handler that change what is rendered from user or lock bump its version
+        etag of response is made from version of every document it is rendered from
+        for example:
+            versions = VersionStore( db )
+            await versions.bump( userIds = [ 'js7694' ], lockIds = [ '12345' ] )
+            await versions.etag( userIds = [ 'js7694' ] ) => 'W/"3f1c0e1e2b7a4c7e"'
+        NOTE: document without version field is version 0, $inc create it
+    '''
+
+    def __init__( self, db, userCollectionName = 'Users', lockCollectionName = 'Locks' ):
+        '''
+            Input: database, name of user collection (str), name of lock collection (str)
+        '''
+
+        self.db = db
+        self.userCollectionName = userCollectionName
+        self.lockCollectionName = lockCollectionName
+
+    async def bump( self, userIds = (), lockIds = () ):
+        '''
+            Increase version of every user and lock
+            Input: list of userId (list)(optional), list of lockId (list)(optional)
+        '''
+
+        userIds = list( set( userIds ) )
+        lockIds = list( set( lockIds ) )
+
+        if userIds:
+            await self.db[self.userCollectionName].update_many( { 'userId': { '$in': userIds } }, { '$inc': { 'version': 1 } } )
+
+        if lockIds:
+            await self.db[self.lockCollectionName].update_many( { 'lockId': { '$in': lockIds } }, { '$inc': { 'version': 1 } } )
+
+    async def etag( self, userIds = (), lockIds = () ):
+        '''
+            Get weak etag from version of every user and lock by one projected query per collection
+            NOTE: version is read before response is rendered so etag is never newer than response
+            Input: list of userId (list)(optional), list of lockId (list)(optional)
+            Output: etag (str) or None if any user or lock is not found or lock is marked as tombstone
+        '''
+
+        parts = list()
+
+        if userIds:
+            users = { user['userId']: user.get( 'version', 0 ) async for user in self.db[self.userCollectionName].find( { 'userId': { '$in': list( userIds ) } }, { '_id': 0, 'userId': 1, 'version': 1 } ) }
+            if len( users ) < len( set( userIds ) ):
+                return None
+            parts += [ 'u:%s:%d' % ( userId, users[userId] ) for userId in userIds ]
+
+        if lockIds:
+            locks = { lock['lockId']: lock.get( 'version', 0 ) async for lock in self.db[self.lockCollectionName].find( { 'lockId': { '$in': list( lockIds ) }, 'deleted': { '$ne': True } }, { '_id': 0, 'lockId': 1, 'version': 1 } ) }
+            if len( locks ) < len( set( lockIds ) ):
+                return None
+            parts += [ 'l:%s:%d' % ( lockId, locks[lockId] ) for lockId in lockIds ]
+
+        return 'W/"%s"' % hashlib.sha1( '|'.join( parts ).encode() ).hexdigest()[:16]
+
+##############################################################
+#
+#   Helper Functions
+#
+
+def etag_matches( ifNoneMatch, etag ):
+    '''
+        Check if etag is in If-None-Match header
+        NOTE: weak comparison, W/ prefix is ignored
+        Input: value of If-None-Match header (str) or None, etag (str)
+        Output: True or False
+    '''
+
+    if not ifNoneMatch:
+        return False
+
+    if ifNoneMatch.strip() == '*':
+        return True
+
+    opaque = lambda tag: tag.strip().removeprefix( 'W/' )
+
+    return opaque( etag ) in { opaque( tag ) for tag in ifNoneMatch.split( ',' ) }